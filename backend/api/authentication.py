@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from foodgram.routers import primary_reads
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+TOKEN_KEY = 'auth-token:{key}'
+# The user fields kept with a cached token. The others, like the
+# password hash and the counters, are left deferred: they are loaded
+# when read and, unless assigned, never written back by save().
+CACHED_USER_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in {
+        'id', 'email', 'username', 'first_name', 'last_name',
+        'is_active', 'is_staff', 'is_superuser'
+    }
+]
+
+
+class TokenCache:
+    """
+    Bounded per-process LRU of authenticated tokens whose entries
+    expire after `timeout` seconds.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(
+    settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TIMEOUT
+)
+
+
+def dump_token(token):
+    user = token.user
+    return (
+        token._state.db,
+        token.created,
+        [getattr(user, field) for field in CACHED_USER_FIELDS],
+    )
+
+
+def load_token(key, entry):
+    """
+    Build fresh Token and User instances from a cached entry, so
+    requests never share a mutable user. The user has only
+    CACHED_USER_FIELDS loaded.
+    """
+    db, created, values = entry
+    user = User.from_db(db, CACHED_USER_FIELDS, values)
+    token = Token.from_db(db, ['key', 'user_id', 'created'], [
+        key, user.pk, created
+    ])
+    token.user = user
+    return user, token
+
+
+def invalidate_tokens(*keys):
+    """
+    Forget the tokens in this process and in the shared cache.
+    Other processes drop them once their entries expire.
+    """
+    for key in keys:
+        token_cache.discard(key)
+    if settings.TOKEN_CACHE_SHARED:
+        cache.delete_many([TOKEN_KEY.format(key=key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that keeps authenticated tokens in the
+    per-process cache and, with TOKEN_CACHE_SHARED, in the shared cache,
+    so steady-state requests authenticate without a query.
+    """
+
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is None and settings.TOKEN_CACHE_SHARED:
+            entry = cache.get(TOKEN_KEY.format(key=key))
+            if entry is not None:
+                token_cache.set(key, entry)
+        if entry is not None:
+            return load_token(key, entry)
+        # A token issued moments ago may not have reached the replicas.
+        with primary_reads():
+            user, token = super().authenticate_credentials(key)
+        entry = dump_token(token)
+        token_cache.set(key, entry)
+        if settings.TOKEN_CACHE_SHARED:
+            cache.set(
+                TOKEN_KEY.format(key=key), entry, settings.TOKEN_CACHE_TIMEOUT
+            )
+        return user, token
@@ -0,0 +1,190 @@
+import hashlib
+from calendar import timegm
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, quote_etag
+from foodgram.routers import primary_reads
+from rest_framework.permissions import SAFE_METHODS
+
+from .compression import (compressed_variants, encoded_etag,
+                          negotiate_encoding, set_content)
+from .versions import bump_version, get_version
+
+RESPONSE_KEY = 'response:{digest}'
+STATS_KEY = 'response-cache:{name}'
+
+
+def increment(name):
+    key = STATS_KEY.format(name=name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def response_cache_stats():
+    stats = cache.get_many([
+        STATS_KEY.format(name=name) for name in ('hits', 'misses')
+    ])
+    return {
+        name: stats.get(STATS_KEY.format(name=name), 0)
+        for name in ('hits', 'misses')
+    }
+
+
+def bump_on_commit(*scopes):
+    """
+    Bump the version stamps of `scopes` once the current transaction
+    commits, so nobody caches data that is not committed yet.
+    """
+    def bump():
+        for scope in scopes:
+            bump_version(scope)
+    transaction.on_commit(bump)
+
+
+def response_cache_key(request, scopes):
+    query = urlencode(sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values
+    ))
+    versions = ':'.join(str(get_version(scope)) for scope in scopes)
+    source = (
+        f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+        f'|{request.accepted_renderer.format}|{versions}'
+    )
+    return RESPONSE_KEY.format(
+        digest=hashlib.md5(source.encode()).hexdigest()
+    )
+
+
+def cache_anonymous(*scopes):
+    """
+    Cache JSON responses to anonymous safe requests until
+    the version stamp of any of `scopes` changes, along with their
+    compressed variants, so hits pay neither for rendering nor for
+    compression.
+
+    Stamps bumped by other processes are only seen through a shared
+    cache; with a process-local one, responses outlive such changes by
+    up to VERSION_TIMEOUT seconds rather than RESPONSE_CACHE_TIMEOUT.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            # Browsable API pages embed the CSRF token of the visitor.
+            if (request.method not in SAFE_METHODS
+                    or request.user.is_authenticated
+                    or request.accepted_renderer.format != 'json'):
+                return handler(view, request, *args, **kwargs)
+            key = response_cache_key(request, scopes)
+            cached = cache.get(key)
+            if cached is not None:
+                increment('hits')
+                content, content_type, variants = cached
+                response = HttpResponse(content, content_type=content_type)
+                encoding = negotiate_encoding(request, variants)
+                if encoding is not None:
+                    set_content(response, variants[encoding], encoding)
+                response['X-Cache'] = 'HIT'
+                return response
+            increment('misses')
+            with primary_reads():
+                response = handler(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                response['X-Cache'] = 'MISS'
+
+                def store(rendered):
+                    variants = compressed_variants(rendered.content)
+                    cache.set(
+                        key,
+                        (rendered.content, rendered['Content-Type'], variants),
+                        settings.RESPONSE_CACHE_TIMEOUT
+                    )
+                    encoding = negotiate_encoding(request, variants)
+                    if encoding is not None:
+                        set_content(rendered, variants[encoding], encoding)
+
+                response.add_post_render_callback(store)
+            return response
+        return wrapper
+    return decorator
+
+
+def response_etag(request, scopes, last_modified=None):
+    """
+    Return a strong ETag of the response to `request` built from
+    the version stamps of `scopes` and the viewer state of the user.
+    """
+    parts = [
+        request.build_absolute_uri(),
+        request.accepted_renderer.format,
+        *(get_version(scope) for scope in scopes),
+    ]
+    if last_modified is not None:
+        parts.append(last_modified.isoformat())
+    user = request.user
+    if user.is_authenticated:
+        parts += [user.id, get_version(f'viewer:{user.id}')]
+    source = '|'.join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(source.encode()).hexdigest())
+
+
+def held_etag(request, etag):
+    """
+    Return the variant of `etag` the client may hold: the one of the
+    negotiated encoding, sent when it made the body shorter, or the one
+    of the identity body.
+    """
+    encoded = encoded_etag(etag, negotiate_encoding(request))
+    if encoded in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        return encoded
+    return etag
+
+
+def conditional(*scopes, last_modified=None):
+    """
+    Answer GET requests carrying a matching `If-None-Match` or
+    `If-Modified-Since` with 304 before the view serializes anything.
+
+    `last_modified(request, **kwargs)` returns the modification time of
+    the object or None when it does not exist.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return handler(view, request, *args, **kwargs)
+            modified = None
+            if last_modified is not None:
+                modified = last_modified(request, **kwargs)
+                if modified is None:
+                    return handler(view, request, *args, **kwargs)
+            etag = response_etag(request, scopes, modified)
+            timestamp = None
+            # The viewer flags of authenticated users change without
+            # touching the object, so only the ETag can validate them.
+            if modified is not None and not request.user.is_authenticated:
+                timestamp = timegm(modified.utctimetuple())
+            held = held_etag(request, etag)
+            response = get_conditional_response(
+                request, etag=held, last_modified=timestamp
+            )
+            if response is None:
+                response = handler(view, request, *args, **kwargs)
+                # Bodies compressed later get the suffix in set_content.
+                held = encoded_etag(etag, response.get('Content-Encoding'))
+            if response.status_code in (200, 304):
+                response['ETag'] = held
+                if timestamp:
+                    response['Last-Modified'] = http_date(timestamp)
+            return response
+        return wrapper
+    return decorator
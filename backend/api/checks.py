@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core import checks
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if settings.VERSION_TIMEOUT is None:
+        return []
+    return [checks.Warning(
+        'The default cache is local to each process.',
+        hint=(
+            'Set CACHE_BACKEND and CACHE_LOCATION to a shared cache, '
+            'e.g. memcached, so version stamps bumped by other workers '
+            'and management commands are seen at once rather than after '
+            'VERSION_TIMEOUT seconds.'
+        ),
+        id='api.W001',
+    )]
@@ -0,0 +1,124 @@
+import re
+
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_LENGTH = 200
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+ACCEPT_ENCODING_RE = re.compile(
+    r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*'
+)
+
+
+def gzip_compress(content):
+    return compress_string(content)
+
+
+def brotli_compress(content):
+    # Quality 5 is several times faster than the maximum of 11 and
+    # compresses JSON nearly as well.
+    return brotli.compress(content, quality=5)
+
+
+# Encodings in the order of preference.
+ENCODINGS = {'gzip': gzip_compress}
+if brotli is not None:
+    ENCODINGS = {'br': brotli_compress, **ENCODINGS}
+
+
+def accepted_encodings(request):
+    accepted = {}
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        match = ACCEPT_ENCODING_RE.fullmatch(part)
+        if match is None:
+            continue
+        name, quality = match.groups()
+        try:
+            accepted[name.lower()] = float(quality or 1)
+        except ValueError:
+            continue
+    return accepted
+
+
+def negotiate_encoding(request, available=ENCODINGS):
+    """
+    Return the preferred encoding from `available` the client accepts
+    or None for the uncompressed content.
+    """
+    accepted = accepted_encodings(request)
+    for encoding in available:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def is_compressible(response):
+    return response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES)
+
+
+def compressed_variants(content):
+    """
+    Return `{encoding: content}` with every encoding that makes
+    `content` shorter.
+
+    The variants are built on a cache miss while the client waits, so
+    they use the same fast settings as the live compression.
+    """
+    variants = {}
+    if len(content) < MIN_LENGTH:
+        return variants
+    for encoding, compress in ENCODINGS.items():
+        compressed = compress(content)
+        if len(compressed) < len(content):
+            variants[encoding] = compressed
+    return variants
+
+
+def encoded_etag(etag, encoding):
+    """
+    Give every encoding of a representation its own strong ETag.
+    """
+    if not encoding:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def set_content(response, content, encoding):
+    response.content = content
+    response['Content-Length'] = str(len(content))
+    response['Content-Encoding'] = encoding
+    if response.has_header('ETag'):
+        response['ETag'] = encoded_etag(response['ETag'], encoding)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress API responses with brotli or gzip as negotiated by
+    `Accept-Encoding`.
+
+    Responses that already carry `Content-Encoding`, e.g. served from
+    the precompressed response cache, are left as they are. The ETag
+    of a compressed body is suffixed with the encoding.
+    """
+
+    def process_response(self, request, response):
+        if (response.streaming or not is_compressible(response)
+                or not request.path.startswith('/api/')):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if (response.has_header('Content-Encoding')
+                or len(response.content) < MIN_LENGTH):
+            return response
+        encoding = negotiate_encoding(request)
+        if encoding is None:
+            return response
+        compressed = ENCODINGS[encoding](response.content)
+        if len(compressed) < len(response.content):
+            set_content(response, compressed, encoding)
+        return response
@@ -2,7 +2,6 @@ from django_filters.rest_framework import FilterSet
 from django_filters.rest_framework.filters import (ModelMultipleChoiceFilter,
                                                    NumberFilter)
 from recipes.models import Recipe, Tag
-from rest_framework.filters import SearchFilter
 
 
 class RecipeFilter(FilterSet):
@@ -31,10 +30,3 @@ class RecipeFilter(FilterSet):
     class Meta:
         model = Recipe
         fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
-
-
-class IngredientFilter(SearchFilter):
-    """
-    Filter for Ingredients.
-    """
-    search_param = 'name'
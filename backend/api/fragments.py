@@ -0,0 +1,171 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from foodgram.routers import primary_reads
+from recipes.models import Recipe, RecipeIngredient, RecipeTag
+
+from .serializers import RecipeFragmentSerializer
+from .services import author_scope
+from .timing import timed
+from .versions import get_versions
+from .viewer_state import get_viewer_state
+
+FRAGMENT_KEY = (
+    'recipe-fragment:{id}:{updated_at}:{author}:{tags}:{ingredients}'
+)
+TAG_FIELDS = ('id', 'name', 'color', 'slug')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit', 'amount')
+
+
+def fragment_key(recipe, versions):
+    return FRAGMENT_KEY.format(
+        id=recipe.id,
+        updated_at=recipe.updated_at.timestamp(),
+        author=versions[author_scope(recipe.author_id)],
+        tags=versions['tags'],
+        ingredients=versions['ingredients']
+    )
+
+
+def serialize_fragments(ids):
+    """
+    Build the fragments of the recipes with `ids`
+    with RecipeFragmentSerializer.
+    """
+    recipes = Recipe.objects.filter(id__in=ids).select_related(
+        'author'
+    ).prefetch_related(
+        'tags',
+        Prefetch(
+            'recipe_amount',
+            queryset=RecipeIngredient.objects.select_related(
+                'ingredients'
+            ).order_by('id')
+        )
+    )
+    serializer = RecipeFragmentSerializer()
+    return {
+        recipe.id: serializer.to_representation(recipe)
+        for recipe in recipes
+    }
+
+
+def values_fragments(ids):
+    """
+    Build the same fragments as serialize_fragments from `.values()`
+    rows with plain dicts, skipping DRF field traversal.
+    """
+    storage = Recipe._meta.get_field('image').storage
+    tags = {recipe_id: [] for recipe_id in ids}
+    for recipe_id, *tag in RecipeTag.objects.filter(
+        recipe_id__in=ids
+    ).values_list(
+        'recipe_id', 'tag_id', 'tag__name', 'tag__color', 'tag__slug'
+    ).order_by('tag__name'):
+        tags[recipe_id].append(dict(zip(TAG_FIELDS, tag)))
+    ingredients = {recipe_id: [] for recipe_id in ids}
+    for recipe_id, *ingredient in RecipeIngredient.objects.filter(
+        recipe_id__in=ids
+    ).values_list(
+        'recipe_id', 'ingredients_id', 'ingredients__name',
+        'ingredients__measurement_unit', 'amount'
+    ).order_by('id'):
+        ingredients[recipe_id].append(
+            dict(zip(INGREDIENT_FIELDS, ingredient))
+        )
+    return {
+        recipe_id: {
+            'id': recipe_id,
+            'author': {
+                'id': author_id,
+                'email': email,
+                'username': username,
+                'first_name': first_name,
+                'last_name': last_name,
+            },
+            'name': name,
+            'image': storage.url(image) if image else None,
+            'text': text,
+            'tags': tags[recipe_id],
+            'ingredients': ingredients[recipe_id],
+            'cooking_time': cooking_time,
+        }
+        for (
+            recipe_id, author_id, email, username, first_name, last_name,
+            name, image, text, cooking_time
+        ) in Recipe.objects.filter(id__in=ids).values_list(
+            'id', 'author_id', 'author__email', 'author__username',
+            'author__first_name', 'author__last_name',
+            'name', 'image', 'text', 'cooking_time'
+        )
+    }
+
+
+FRAGMENT_BUILDERS = {
+    'serializer': serialize_fragments,
+    'values': values_fragments,
+}
+
+
+def recipe_fragments(recipes):
+    """
+    Return `{recipe_id: fragment}` for `recipes`, which only need
+    `id`, `author_id` and `updated_at` loaded, building and storing
+    the missing fragments with the builder chosen by
+    RECIPE_READ_SERIALIZER.
+    """
+    versions = get_versions({
+        'tags', 'ingredients',
+        *(author_scope(recipe.author_id) for recipe in recipes)
+    })
+    keys = {recipe.id: fragment_key(recipe, versions) for recipe in recipes}
+    cached = cache.get_many(keys.values())
+    fragments = {
+        pk: cached[key] for pk, key in keys.items() if key in cached
+    }
+    missing = [pk for pk in keys if pk not in fragments]
+    if missing:
+        build = FRAGMENT_BUILDERS[settings.RECIPE_READ_SERIALIZER]
+        with primary_reads():
+            built = build(missing)
+        cache.set_many(
+            {keys[pk]: fragment for pk, fragment in built.items()},
+            settings.RECIPE_FRAGMENT_TIMEOUT
+        )
+        fragments.update(built)
+    return fragments
+
+
+def splice_fragments(recipes, fragments, request):
+    """
+    Return the RecipeGetSerializer representation of `recipes` made of
+    their fragments and the viewer flags of the request user.
+    """
+    state = get_viewer_state(request)
+    user = request.user
+    data = []
+    for recipe in recipes:
+        fragment = fragments.get(recipe.id)
+        if fragment is None:
+            continue
+        author = fragment['author']
+        image = fragment['image']
+        data.append({
+            **fragment,
+            'author': {
+                **author,
+                'is_subscribed': (
+                    user.is_authenticated and user.id != author['id']
+                    and state.is_subscribed(author['id'])
+                ),
+            },
+            'image': image and request.build_absolute_uri(image),
+            'is_favorited': state.is_favorited(recipe.id),
+            'is_in_shopping_cart': state.is_in_shopping_cart(recipe.id),
+        })
+    return data
+
+
+def render_recipes(recipes, request):
+    with timed(request, 'serialize'):
+        return splice_fragments(recipes, recipe_fragments(recipes), request)
@@ -0,0 +1,288 @@
+import json
+import logging
+import queue
+import random
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from api.timing import QueryRecorder
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+DEFAULT_MIX = {
+    'feed': 40,
+    'tag': 20,
+    'autocomplete': 25,
+    'favorite': 10,
+    'cart': 5,
+}
+FEED_PAGES = 10
+# Draws of a recipe the user has not favorited before giving up.
+FAVORITE_ATTEMPTS = 20
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(values):
+    mix = {}
+    for value in values:
+        name, _, weight = value.partition('=')
+        if name not in DEFAULT_MIX:
+            raise CommandError(
+                f'Unknown scenario {name!r}, choose from '
+                f'{", ".join(DEFAULT_MIX)}.'
+            )
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise CommandError(f'Invalid weight of {name!r}: {weight!r}.')
+    return mix
+
+
+def percentile(values, q):
+    """
+    Return the nearest-rank `q` percentile of sorted `values`.
+    """
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * q // 100))
+    return values[int(rank) - 1]
+
+
+def summarize(samples, duration):
+    latencies = sorted(latency for latency, _, _ in samples)
+    queries = [count for _, count, _ in samples]
+    summary = {
+        'requests': len(samples),
+        'errors': sum(status >= 400 for _, _, status in samples),
+        'throughput_rps': round(len(samples) / duration, 1),
+        'latency_ms': {
+            f'p{q}': round(percentile(latencies, q) * 1000, 2)
+            for q in PERCENTILES
+        },
+        'queries_per_request': {
+            'mean': round(sum(queries) / len(queries), 2),
+            'max': max(queries),
+        },
+        'statuses': dict(sorted(
+            Counter(str(status) for _, _, status in samples).items()
+        )),
+    }
+    summary['latency_ms']['mean'] = round(
+        sum(latencies) / len(latencies) * 1000, 2
+    )
+    summary['latency_ms']['max'] = round(latencies[-1] * 1000, 2)
+    return summary
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the API through the test client from a pool of threads '
+        'with a mix of scenarios and report latency percentiles, '
+        'throughput and queries per request as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=1000,
+            help='Scenarios to run, a favorite toggle makes two requests.'
+        )
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument(
+            '--warmup', type=int, default=100,
+            help='Requests to run before measuring, not reported.'
+        )
+        parser.add_argument(
+            '--mix', nargs='+', default=[], metavar='SCENARIO=WEIGHT',
+            help=(
+                'Relative weights of the scenarios: '
+                f'{", ".join(f"{k}={v}" for k, v in DEFAULT_MIX.items())}.'
+            )
+        )
+        parser.add_argument(
+            '--users', type=int, default=50,
+            help='Number of users behind the authenticated scenarios.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output', help='Write the report to this file.'
+        )
+
+    def handle(self, *args, **options):
+        for name in ('requests', 'concurrency'):
+            if options[name] < 1:
+                raise CommandError(f'--{name} must be positive.')
+        if options['warmup'] < 0:
+            raise CommandError('--warmup can not be negative.')
+        self.rng = random.Random(options['seed'])
+        mix = {**DEFAULT_MIX, **parse_mix(options['mix'])}
+        self.load_data(options['users'])
+        plan = self.plan(mix, options['warmup'] + options['requests'])
+        # Request logging would dominate the measurements.
+        timing_logger = logging.getLogger('api.timing')
+        level = timing_logger.level
+        timing_logger.setLevel(logging.WARNING)
+        try:
+            self.run(plan[:options['warmup']], options['concurrency'])
+            start = time.perf_counter()
+            samples = self.run(
+                plan[options['warmup']:], options['concurrency']
+            )
+            duration = time.perf_counter() - start
+        finally:
+            timing_logger.setLevel(level)
+        if not samples:
+            raise CommandError('No scenario had anything to request.')
+        by_scenario = defaultdict(list)
+        for name, sample in samples:
+            by_scenario[name].append(sample)
+        report = json.dumps({
+            'config': {
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'warmup': options['warmup'],
+                'users': len(self.tokens),
+                'seed': options['seed'],
+                'mix': mix,
+            },
+            'duration_s': round(duration, 3),
+            'total': summarize([sample for _, sample in samples], duration),
+            'scenarios': {
+                name: summarize(by_scenario[name], duration)
+                for name in mix if by_scenario[name]
+            },
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(report + '\n')
+        self.stdout.write(report)
+
+    def load_data(self, users):
+        self.recipes = list(
+            Recipe.objects.order_by('id').values_list('id', flat=True)
+        )
+        self.tags = list(
+            Tag.objects.order_by('id').values_list('slug', flat=True)
+        )
+        self.ingredients = list(
+            Ingredient.objects.order_by('id').values_list('name', flat=True)
+        )
+        if not (self.recipes and self.tags and self.ingredients):
+            raise CommandError(
+                'No recipes, tags or ingredients, run generate_dataset first.'
+            )
+        # Prefer users with something to download.
+        candidates = list(
+            ShoppingCart.objects.order_by('user_id')
+            .values_list('user_id', flat=True).distinct()
+        ) or list(User.objects.order_by('id').values_list('id', flat=True))
+        chosen = sorted(
+            self.rng.sample(candidates, min(users, len(candidates)))
+        )
+        if not chosen:
+            raise CommandError('No users, run generate_dataset first.')
+        self.tokens = {
+            user: Token.objects.get_or_create(user_id=user)[0].key
+            for user in chosen
+        }
+        self.favorites = set(Favorite.objects.filter(
+            user_id__in=chosen
+        ).values_list('user_id', 'recipe_id'))
+
+    def plan(self, mix, count):
+        """
+        Draw the whole sequence of requests up front, so runs with the
+        same seed and data issue the same requests. Scenarios that find
+        nothing to request are skipped.
+        """
+        names = [name for name, weight in mix.items() if weight > 0]
+        if not names:
+            raise CommandError('All scenario weights are zero.')
+        weights = [mix[name] for name in names]
+        plan = []
+        for name in self.rng.choices(names, weights, k=count):
+            requests = getattr(self, f'plan_{name}')()
+            if requests is not None:
+                plan.append((name, requests))
+        return plan
+
+    def plan_feed(self):
+        page = self.rng.randint(1, FEED_PAGES)
+        return [('get', f'/api/recipes/?page={page}', None)]
+
+    def plan_tag(self):
+        tag = self.rng.choice(self.tags)
+        return [('get', f'/api/recipes/?tags={tag}', None)]
+
+    def plan_autocomplete(self):
+        name = self.rng.choice(self.ingredients)
+        prefix = name[:self.rng.randint(1, min(4, len(name)))]
+        return [('get', f'/api/ingredients/?name={prefix}', None)]
+
+    def plan_favorite(self):
+        # Toggle a recipe the user has not favorited, so the dataset
+        # is left as it was.
+        user = self.rng.choice(list(self.tokens))
+        for _ in range(FAVORITE_ATTEMPTS):
+            recipe = self.rng.choice(self.recipes)
+            if (user, recipe) not in self.favorites:
+                url = f'/api/recipes/{recipe}/favorite/'
+                token = self.tokens[user]
+                return [('post', url, token), ('delete', url, token)]
+        return None
+
+    def plan_cart(self):
+        token = self.tokens[self.rng.choice(list(self.tokens))]
+        return [('get', '/api/recipes/download_shopping_cart/', token)]
+
+    def run(self, plan, concurrency):
+        tasks = queue.SimpleQueue()
+        for task in plan:
+            tasks.put(task)
+
+        def worker():
+            client = Client()
+            samples = []
+            try:
+                while True:
+                    try:
+                        name, requests = tasks.get_nowait()
+                    except queue.Empty:
+                        return samples
+                    samples.extend(
+                        (name, self.request(client, *request))
+                        for request in requests
+                    )
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            futures = [executor.submit(worker) for _ in range(concurrency)]
+        return [sample for future in futures for sample in future.result()]
+
+    @staticmethod
+    def request(client, method, url, token):
+        headers = {}
+        if token:
+            headers['HTTP_AUTHORIZATION'] = f'Token {token}'
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            try:
+                response = getattr(client, method)(url, **headers)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                status = response.status_code
+            except Exception:
+                # The test client re-raises errors of the view.
+                status = 500
+        return time.perf_counter() - start, recorder.count, status
@@ -0,0 +1,94 @@
+import io
+import time
+
+from api.fragments import splice_fragments, values_fragments
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+from api.search import ingredient_index
+from api.serializers import IngredientSerializer
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from recipes.models import Recipe
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+
+class Command(BaseCommand):
+    help = (
+        'Check that FastJSONRenderer renders the same bytes as '
+        'JSONRenderer and compare the speed of the renderers and parsers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=50,
+            help='Number of the newest recipes to render.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=100,
+            help='Number of timed runs of every renderer and parser.'
+        )
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = AnonymousUser()
+        recipes = list(Recipe.objects.order_by('-pub_date', '-id').only(
+            'id', 'updated_at'
+        )[:options['limit']])
+        payloads = {
+            'recipes': splice_fragments(recipes, values_fragments(
+                [recipe.id for recipe in recipes]
+            ), request),
+            'ingredients': IngredientSerializer(
+                ingredient_index.search(''), many=True
+            ).data,
+            'types': {
+                'now': timezone.now(),
+                'today': timezone.now().date(),
+                1: 'ключ',
+                'separators': '  ',
+            },
+        }
+        for name, data in payloads.items():
+            self.stdout.write(f'{name}:')
+            content = self.compare_renderers(data, options['repeat'])
+            self.compare_parsers(content, options['repeat'])
+
+    def timed(self, label, function, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        elapsed = (time.perf_counter() - start) / repeat
+        self.stdout.write(f'  {label}: {elapsed * 1000:.3f} ms')
+        return elapsed
+
+    def compare_renderers(self, data, repeat):
+        expected = JSONRenderer().render(data)
+        actual = FastJSONRenderer().render(data)
+        if expected != actual:
+            raise CommandError(
+                f'The renderers differ:\n{expected[:500]}\n{actual[:500]}'
+            )
+        slow = self.timed(
+            f'JSONRenderer ({len(expected)} bytes)',
+            lambda: JSONRenderer().render(data), repeat
+        )
+        fast = self.timed(
+            'FastJSONRenderer', lambda: FastJSONRenderer().render(data),
+            repeat
+        )
+        self.stdout.write(f'  render speedup: {slow / fast:.1f}x')
+        return expected
+
+    def compare_parsers(self, content, repeat):
+        def parse(parser):
+            return lambda: parser.parse(io.BytesIO(content))
+
+        if parse(JSONParser())() != parse(FastJSONParser())():
+            raise CommandError('The parsers differ.')
+        slow = self.timed('JSONParser', parse(JSONParser()), repeat)
+        fast = self.timed('FastJSONParser', parse(FastJSONParser()), repeat)
+        self.stdout.write(f'  parse speedup: {slow / fast:.1f}x')
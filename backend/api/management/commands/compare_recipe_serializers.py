@@ -0,0 +1,92 @@
+import time
+
+from api.fragments import splice_fragments, values_fragments
+from api.serializers import RecipeGetSerializer
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from recipes.models import Recipe, RecipeIngredient
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+User = get_user_model()
+
+
+def get_request(username=None):
+    request = Request(APIRequestFactory().get('/api/recipes/'))
+    request.user = AnonymousUser()
+    if username:
+        try:
+            request.user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f'There is no user {username}.')
+    return request
+
+
+def serializer_data(recipes, request):
+    queryset = Recipe.objects.filter(
+        id__in=[recipe.id for recipe in recipes]
+    ).order_by('-pub_date', '-id').select_related('author').prefetch_related(
+        'tags',
+        Prefetch(
+            'recipe_amount',
+            queryset=RecipeIngredient.objects.select_related(
+                'ingredients'
+            ).order_by('id')
+        )
+    )
+    return RecipeGetSerializer(
+        queryset, many=True, context={'request': request}
+    ).data
+
+
+def values_data(recipes, request):
+    fragments = values_fragments([recipe.id for recipe in recipes])
+    return splice_fragments(recipes, fragments, request)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the speed of rendering recipes with RecipeGetSerializer '
+        'and with the values-based serializer.'
+    )
+    renderer = JSONRenderer()
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=50,
+            help='Number of the newest recipes to render.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Number of timed renders of every serializer.'
+        )
+        parser.add_argument(
+            '--user',
+            help='Username of the viewer, anonymous by default.'
+        )
+
+    def handle(self, *args, **options):
+        request = get_request(options['user'])
+        recipes = list(Recipe.objects.order_by('-pub_date', '-id').only(
+            'id', 'updated_at'
+        )[:options['limit']])
+        if not recipes:
+            raise CommandError('There are no recipes to render.')
+        self.benchmark(recipes, request, options['repeat'])
+
+    def benchmark(self, recipes, request, repeat):
+        timings = {}
+        for name, data in (
+            ('serializer', serializer_data), ('values', values_data)
+        ):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                self.renderer.render(data(recipes, request))
+            timings[name] = (time.perf_counter() - start) / repeat
+            self.stdout.write(f'{name}: {timings[name] * 1000:.2f} ms')
+        self.stdout.write(
+            f'Speedup: {timings["serializer"] / timings["values"]:.1f}x'
+        )
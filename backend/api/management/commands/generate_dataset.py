@@ -0,0 +1,305 @@
+import csv
+import io
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from api.search import ingredient_index
+from api.services import reconcile_counters
+from api.versions import bump_version
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, ShoppingListItem, Tag)
+from users.models import Subscription
+
+User = get_user_model()
+
+PASSWORD = 'password'
+FIRST_NAMES = (
+    'Anna', 'Boris', 'Vera', 'Gleb', 'Daria', 'Egor', 'Zoya', 'Ivan',
+    'Kira', 'Lev', 'Maria', 'Nikita', 'Olga', 'Pavel', 'Raisa', 'Semyon',
+)
+LAST_NAMES = (
+    'Ivanov', 'Petrova', 'Smirnov', 'Kuznetsova', 'Popov', 'Sokolova',
+    'Lebedev', 'Kozlova', 'Novikov', 'Morozova', 'Volkov', 'Zaitseva',
+)
+WORDS = (
+    'mix', 'stir', 'bake', 'boil', 'chop', 'slice', 'add', 'serve', 'heat',
+    'season', 'pour', 'whisk', 'simmer', 'fry', 'cool', 'the', 'with',
+    'until', 'golden', 'minutes', 'gently', 'bowl', 'pan', 'oven', 'salt',
+)
+ADJECTIVES = (
+    'Homemade', 'Quick', 'Spicy', 'Classic', 'Grandma\'s', 'Summer',
+    'Winter', 'Creamy', 'Crispy', 'Light', 'Festive', 'Rustic',
+)
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F5A9B8', 'dessert'),
+    ('Вегетарианское', '#2E8B57', 'vegetarian'),
+)
+AMOUNTS = (1, 2, 3, 5, 10, 20, 50, 100, 150, 200, 250, 300, 500, 1000)
+SHOPPING_LIST_SQL = """
+    INSERT INTO {items} (user_id, ingredient_id, amount)
+    SELECT cart.user_id, amount.ingredients_id, SUM(amount.amount)
+    FROM {carts} AS cart
+    JOIN {amounts} AS amount ON amount.recipe_id = cart.recipe_id
+    WHERE cart.user_id >= %s
+    GROUP BY cart.user_id, amount.ingredients_id
+"""
+
+
+def zipf(population, exponent):
+    """
+    Return a sampler of `k` items of `population`, the first being
+    the most popular, with Zipf-distributed probabilities.
+    """
+    cum_weights = list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, len(population) + 1)
+    ))
+
+    def sample(rng, k):
+        return rng.choices(population, cum_weights=cum_weights, k=k)
+    return sample
+
+
+def distinct(sample, rng, count, limit):
+    """
+    Draw `count` distinct items, giving up after `limit` attempts,
+    since popular items are drawn over and over.
+    """
+    chosen = set()
+    for _ in range(limit):
+        chosen.update(sample(rng, count - len(chosen)))
+        if len(chosen) >= count:
+            break
+    return chosen
+
+
+def columns(model, fields):
+    return [model._meta.get_field(field).column for field in fields]
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a reproducible synthetic dataset of users, recipes, '
+        'favorites, carts and subscriptions for scale testing.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--favorites', type=float, default=20,
+            help='Average number of favorites per user.'
+        )
+        parser.add_argument(
+            '--carts', type=float, default=3,
+            help='Average number of recipes in a shopping cart.'
+        )
+        parser.add_argument(
+            '--subscriptions', type=float, default=10,
+            help='Average number of subscriptions per user.'
+        )
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='Zipf exponent of author and recipe popularity.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.use_copy = connection.vendor == 'postgresql'
+        start = time.monotonic()
+        with transaction.atomic():
+            tags = self.get_tags()
+            ingredients = self.get_ingredients()
+            users = self.create_users(options['users'])
+            recipes = self.create_recipes(
+                options['recipes'], users, ingredients, tags,
+                options['exponent']
+            )
+            self.create_relations(users, recipes, options)
+            self.create_shopping_lists(users)
+            reconcile_counters()
+            self.reset_sequences()
+        ingredient_index.reset()
+        bump_version('tags')
+        bump_version('recipes')
+        self.stdout.write(
+            f'Generated {len(users)} users and {len(recipes)} recipes '
+            f'in {time.monotonic() - start:.1f} s.'
+        )
+
+    def insert(self, model, fields, rows):
+        """
+        Insert `rows` of `fields` values in batches with COPY on
+        PostgreSQL and executemany elsewhere. Unlike bulk_create this
+        keeps the given auto_now values and skips model instances.
+        """
+        table = connection.ops.quote_name(model._meta.db_table)
+        names = ', '.join(
+            connection.ops.quote_name(column)
+            for column in columns(model, fields)
+        )
+        count = 0
+        with connection.cursor() as cursor:
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    break
+                count += len(batch)
+                if self.use_copy:
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(batch)
+                    buffer.seek(0)
+                    cursor.copy_expert(
+                        f'COPY {table} ({names}) FROM STDIN WITH CSV', buffer
+                    )
+                else:
+                    cursor.executemany(
+                        f'INSERT INTO {table} ({names}) VALUES '
+                        f'({", ".join(["%s"] * len(fields))})',
+                        batch
+                    )
+        self.stdout.write(f'{model.__name__}: {count} rows')
+        return count
+
+    def next_ids(self, model, count):
+        start = (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        return range(start, start + count)
+
+    def get_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            )
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def get_ingredients(self):
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'ingredient {i}', measurement_unit='g')
+                for i in range(2000)
+            )
+        ingredients = list(Ingredient.objects.order_by('id').values_list(
+            'id', 'name'
+        ))
+        # The first ingredients are the most used ones.
+        self.rng.shuffle(ingredients)
+        return ingredients
+
+    def create_users(self, count):
+        users = self.next_ids(User, count)
+        password = make_password(PASSWORD)
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        self.insert(User, (
+            'id', 'password', 'is_superuser', 'username', 'first_name',
+            'last_name', 'email', 'is_staff', 'is_active', 'date_joined',
+            'recipes_count', 'followers_count',
+        ), (
+            (
+                pk, password, False, f'user{pk}',
+                self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES),
+                f'user{pk}@example.com', False, True, now, 0, 0
+            )
+            for pk in users
+        ))
+        return users
+
+    def create_recipes(self, count, users, ingredients, tags, exponent):
+        recipes = self.next_ids(Recipe, count)
+        authors = zipf(users, exponent)
+        popular_ingredients = zipf(ingredients, 1)
+        now = timezone.now()
+        self.insert(Recipe, (
+            'id', 'author_id', 'name', 'image', 'text', 'cooking_time',
+            'pub_date', 'updated_at', 'favorites_count', 'carts_count',
+        ), (
+            self.recipe_row(pk, author, ingredients, now)
+            for pk, author in zip(recipes, self.stream(authors, count))
+        ))
+        self.insert(RecipeIngredient, (
+            'recipe_id', 'ingredients_id', 'amount'
+        ), (
+            (pk, ingredient, self.rng.choice(AMOUNTS))
+            for pk in recipes
+            for ingredient, _ in sorted(distinct(
+                popular_ingredients, self.rng, self.rng.randint(3, 12), 10
+            ))
+        ))
+        self.insert(RecipeTag, ('recipe_id', 'tag_id'), (
+            (pk, tag)
+            for pk in recipes
+            for tag in self.rng.sample(
+                tags, min(len(tags), self.rng.randint(1, 3))
+            )
+        ))
+        return recipes
+
+    def create_relations(self, users, recipes, options):
+        popular_recipes = zipf(recipes, options['exponent'])
+        popular_authors = zipf(users, options['exponent'])
+        for model, field, sample, population, average in (
+            (Favorite, 'recipe_id', popular_recipes, recipes,
+             options['favorites']),
+            (ShoppingCart, 'recipe_id', popular_recipes, recipes,
+             options['carts']),
+            (Subscription, 'author_id', popular_authors, users,
+             options['subscriptions']),
+        ):
+            self.insert(model, ('user_id', field), (
+                (user, item)
+                for user in users
+                for item in sorted(distinct(
+                    sample, self.rng, self.count(average, len(population)), 10
+                ))
+                if item != user or model is not Subscription
+            ))
+
+    def create_shopping_lists(self, users):
+        with connection.cursor() as cursor:
+            cursor.execute(SHOPPING_LIST_SQL.format(
+                items=ShoppingListItem._meta.db_table,
+                carts=ShoppingCart._meta.db_table,
+                amounts=RecipeIngredient._meta.db_table,
+            ), [users.start])
+
+    def reset_sequences(self):
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Recipe]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def stream(self, sample, count):
+        for start in range(0, count, self.batch_size):
+            yield from sample(self.rng, min(self.batch_size, count - start))
+
+    def count(self, average, limit):
+        return min(limit, int(self.rng.expovariate(1 / average)))
+
+    def recipe_row(self, pk, author, ingredients, now):
+        _, ingredient = self.rng.choice(ingredients)
+        published = connection.ops.adapt_datetimefield_value(
+            now - timedelta(seconds=self.rng.randrange(365 * 24 * 60 * 60))
+        )
+        text = ' '.join(self.rng.choices(WORDS, k=self.rng.randint(20, 80)))
+        return (
+            pk, author, f'{self.rng.choice(ADJECTIVES)} {ingredient}'[:200],
+            'recipes/placeholder.png', f'{text.capitalize()}.',
+            self.rng.choice((5, 10, 15, 20, 30, 45, 60, 90, 120)),
+            published, published, 0, 0
+        )
@@ -1,5 +1,6 @@
 import csv
 
+from api.search import ingredient_index
 from django.core.management.base import BaseCommand
 from recipes.models import Ingredient
 
@@ -24,9 +25,13 @@ class Command(BaseCommand):
             options['file_path'], 'r', encoding='utf-8'
         ) as csv_file:
             reader = csv.DictReader(csv_file)
-            Ingredient.objects.bulk_create(
+            ingredients = Ingredient.objects.bulk_create(
                 Ingredient(**data) for data in reader
             )
+            if all(ingredient.pk for ingredient in ingredients):
+                ingredient_index.invalidate(changed=ingredients)
+            else:
+                ingredient_index.reset()
             self.stdout.write(
                 'Выполнен импорт данных для таблицы Ingredient.'
             )
@@ -0,0 +1,42 @@
+from api.services import expected_shopping_lists, update_shopping_lists
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Rebuild aggregated shopping lists from the shopping carts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report the items that drifted from the carts.'
+        )
+
+    def handle(self, *args, **options):
+        expected = expected_shopping_lists()
+        actual = {
+            (user, ingredient): amount
+            for user, ingredient, amount
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ).iterator()
+        }
+        drift = {
+            key: expected.get(key, 0) - actual.get(key, 0)
+            for key in expected.keys() | actual.keys()
+            if expected.get(key, 0) != actual.get(key, 0)
+        }
+        if options['verify']:
+            for (user, ingredient), delta in sorted(drift.items()):
+                self.stdout.write(
+                    f'user {user}, ingredient {ingredient}: '
+                    f'expected {expected.get((user, ingredient), 0)}, '
+                    f'stored {actual.get((user, ingredient), 0)}'
+                )
+            if drift:
+                raise CommandError(f'{len(drift)} items drifted.')
+            self.stdout.write('Shopping lists are consistent.')
+            return
+        update_shopping_lists(drift)
+        self.stdout.write(f'Fixed {len(drift)} shopping list items.')
@@ -0,0 +1,10 @@
+from api.services import reconcile_counters
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Recount denormalized favorite, cart, recipe and follower counters.'
+
+    def handle(self, *args, **options):
+        for counter, fixed in reconcile_counters().items():
+            self.stdout.write(f'{counter}: fixed {fixed} rows.')
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionStamp',
+            fields=[
+                ('scope', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='scope')),
+                ('version', models.BigIntegerField(verbose_name='version')),
+            ],
+        ),
+    ]
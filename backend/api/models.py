@@ -0,0 +1,18 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class VersionStamp(models.Model):
+    """
+    Durable version stamp of a cache scope. The cache only fronts it,
+    so a stamp that expires or is evicted comes back unchanged.
+    """
+    scope = models.CharField(
+        max_length=100,
+        primary_key=True,
+        verbose_name=_('scope')
+    )
+    version = models.BigIntegerField(verbose_name=_('version'))
+
+    def __str__(self):
+        return f'{self.scope}: {self.version}'
@@ -1,5 +1,179 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, PageNumberPagination,
+                                       _positive_int)
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+MIN_INT, MAX_INT = -2 ** 63, 2 ** 63 - 1
 
 
 class PageLimitPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination without COUNT(*) and OFFSET.
+
+    The last field of the ordering must be unique, so every row has
+    a stable position. The view may override the ordering with
+    a `cursor_ordering` attribute.
+    """
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = None
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), 'page'
+        )
+        values, reverse = self.decode_cursor(request, queryset.model)
+        ordering = self.get_ordering(reverse)
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.get_keyset_filter(
+                ordering, values
+            ))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next = values is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = values is not None
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, reverse=False):
+        if not reverse:
+            return self.ordering
+        return tuple(
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        )
+
+    @staticmethod
+    def get_keyset_filter(ordering, values):
+        keyset_filter = Q()
+        equal = {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            keyset_filter |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return keyset_filter
+
+    def get_position(self, obj):
+        position = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            if isinstance(value, (date, datetime)):
+                value = value.isoformat()
+            position.append(value)
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(
+            self.get_position(self.page[0]), reverse=True
+        )
+
+    def encode_cursor(self, values, reverse=False):
+        cursor = json.dumps({'v': values, 'r': int(reverse)})
+        encoded = base64.urlsafe_b64encode(cursor.encode()).decode()
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded
+        )
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values, reverse = cursor['v'], bool(cursor['r'])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return self.to_python(model, values), reverse
+
+    def to_python(self, model, values):
+        """
+        Convert the cursor values with the fields of the ordering,
+        so a well-formed cursor with wrong values is a 404 too.
+        """
+        converted = []
+        for field, value in zip(self.ordering, values):
+            field = model._meta.get_field(field.lstrip('-'))
+            if value is None or isinstance(value, (dict, list)):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                value = field.to_python(value)
+            except (ValidationError, ValueError, TypeError, OverflowError):
+                raise NotFound(self.invalid_cursor_message)
+            if isinstance(value, int) and not MIN_INT <= value <= MAX_INT:
+                raise NotFound(self.invalid_cursor_message)
+            converted.append(value)
+        return converted
+
+
+class PageLimitOrKeysetPagination(PageLimitPagination):
+    """
+    Page number pagination that switches to keyset pagination
+    when the request carries a `cursor` parameter (`?cursor=` for
+    the first page).
+    """
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        cursor_param = self.keyset_pagination_class.cursor_query_param
+        if cursor_param in request.query_params:
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
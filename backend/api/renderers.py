@@ -0,0 +1,86 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer producing the same bytes with orjson.
+
+    Types orjson renders differently (datetimes, lazy strings, querysets)
+    go through the DRF encoder. Indented or ASCII-only output and values
+    orjson rejects fall back to JSONRenderer, as does a missing orjson.
+    """
+    default = JSONEncoder().default
+
+    def can_render(self, data, accepted_media_type, renderer_context):
+        return (
+            orjson is not None and data is not None and self.compact
+            and not self.ensure_ascii and self.get_indent(
+                accepted_media_type, renderer_context or {}
+            ) is None
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not self.can_render(data, accepted_media_type, renderer_context):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME
+                | orjson.OPT_NON_STR_KEYS
+            )
+        except orjson.JSONEncodeError:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        # Keep the output a strict JavaScript subset, like JSONRenderer.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029'
+            )
+        return ret
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """
+    Selects the shopping list export format by `?format=` or `Accept`.
+
+    The list itself is streamed by the view, so only error responses
+    are rendered here.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
@@ -0,0 +1,210 @@
+import heapq
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+from foodgram.routers import primary_reads
+from recipes.models import Ingredient
+
+from .versions import bump_version, get_version
+
+
+def normalize(text):
+    return text.casefold().replace('ё', 'е').strip()
+
+
+def trigrams(text):
+    """
+    Return the set of character trigrams of `text` the way pg_trgm
+    does: every word is padded with two spaces in front and one behind.
+    """
+    result = set()
+    for word in text.split():
+        padded = f'  {word} '
+        result.update(
+            padded[i:i + 3] for i in range(len(padded) - 2)
+        )
+    return result
+
+
+class Catalog:
+    """
+    Immutable snapshot of the Ingredient catalog.
+
+    `keys` holds sorted `(normalized name, name, id)` tuples aligned
+    with `ingredients`. The trigram index maps every trigram to the ids
+    of the names containing it and is built on first fuzzy search.
+    """
+
+    def __init__(self, version, keys, ingredients, postings=None):
+        self.version = version
+        self.keys = keys
+        self.ingredients = ingredients
+        self.by_id = {
+            key[2]: (key, ingredient)
+            for key, ingredient in zip(keys, ingredients)
+        }
+        self._postings = postings
+
+    @property
+    def postings(self):
+        if self._postings is None:
+            postings = {}
+            for (name, _, pk) in self.keys:
+                self._add_postings(postings, name, pk)
+            self._postings = postings
+        return self._postings
+
+    @staticmethod
+    def _add_postings(postings, name, pk):
+        name_trigrams = trigrams(name)
+        for trigram in name_trigrams:
+            postings.setdefault(trigram, {})[pk] = len(name_trigrams)
+
+    def apply(self, version, changed, deleted):
+        stale = {ingredient.id for ingredient in changed}
+        stale.update(ingredient.id for ingredient in deleted)
+        keys, ingredients = [], []
+        for key, ingredient in zip(self.keys, self.ingredients):
+            if key[2] not in stale:
+                keys.append(key)
+                ingredients.append(ingredient)
+        postings = None
+        if self._postings is not None:
+            postings = {
+                trigram: {
+                    pk: size for pk, size in ids.items() if pk not in stale
+                }
+                for trigram, ids in self._postings.items()
+            }
+        for ingredient in changed:
+            key = (normalize(ingredient.name), ingredient.name, ingredient.id)
+            position = bisect_left(keys, key)
+            keys.insert(position, key)
+            ingredients.insert(position, Ingredient(
+                id=ingredient.id,
+                name=ingredient.name,
+                measurement_unit=ingredient.measurement_unit
+            ))
+            if postings is not None:
+                self._add_postings(postings, key[0], ingredient.id)
+        return Catalog(version, keys, ingredients, postings)
+
+
+class IngredientIndex:
+    """
+    Per-process index of the Ingredient catalog for autocomplete.
+
+    The index is loaded on first use and rebuilt whenever
+    the `ingredients` version stamp changes. Changes made by this
+    process are applied incrementally.
+    """
+    scope = 'ingredients'
+    fuzzy_limit = 10
+    fuzzy_threshold = 0.3
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._catalog = None
+
+    def load(self):
+        version = get_version(self.scope)
+        catalog = self._catalog
+        if catalog is not None and catalog.version == version:
+            return catalog
+        with self._lock:
+            if self._catalog is None or self._catalog.version != version:
+                self._catalog = self.build(version)
+            return self._catalog
+
+    def build(self, version):
+        with primary_reads():
+            rows = list(Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ))
+        entries = sorted(
+            (normalize(name), name, pk, Ingredient(
+                id=pk, name=name, measurement_unit=measurement_unit
+            ))
+            for pk, name, measurement_unit in rows
+        )
+        return Catalog(
+            version,
+            [entry[:3] for entry in entries],
+            [entry[3] for entry in entries]
+        )
+
+    def search(self, query):
+        """
+        Return ingredients whose name starts with `query`, followed by
+        those containing it elsewhere.
+        """
+        catalog = self.load()
+        keys, ingredients = catalog.keys, catalog.ingredients
+        query = normalize(query)
+        if not query:
+            return list(ingredients)
+        start = bisect_left(keys, (query,))
+        end = bisect_left(keys, (query + chr(0x10ffff),), start)
+        prefixed = ingredients[start:end]
+        contained = [
+            ingredient
+            for (name, _, _), ingredient in zip(keys, ingredients)
+            if query in name and not name.startswith(query)
+        ]
+        return prefixed + contained
+
+    def fuzzy_search(self, query, limit=None, threshold=None):
+        """
+        Return up to `limit` ingredients ordered by trigram similarity
+        to `query`, skipping those less similar than `threshold`.
+        """
+        limit = limit or self.fuzzy_limit
+        if threshold is None:
+            threshold = self.fuzzy_threshold
+        catalog = self.load()
+        query_trigrams = trigrams(normalize(query))
+        if not query_trigrams:
+            return []
+        postings = catalog.postings
+        shared = Counter()
+        sizes = {}
+        for trigram in query_trigrams:
+            ids = postings.get(trigram, {})
+            shared.update(ids.keys())
+            sizes.update(ids)
+        scored = []
+        for pk, count in shared.items():
+            similarity = count / (len(query_trigrams) + sizes[pk] - count)
+            if similarity >= threshold:
+                key, ingredient = catalog.by_id[pk]
+                scored.append((-similarity, key, ingredient))
+        return [
+            ingredient for _, _, ingredient
+            in heapq.nsmallest(limit, scored, key=lambda item: item[:2])
+        ]
+
+    def invalidate(self, changed=(), deleted=()):
+        """
+        Bump the version stamp after a catalog change. Changes are
+        applied in place when nothing else changed the catalog since
+        the index was loaded; otherwise it is rebuilt on next use.
+        """
+        with self._lock:
+            catalog, self._catalog = self._catalog, None
+            version = bump_version(self.scope)
+            if catalog is None or version != catalog.version + 1:
+                return
+            self._catalog = catalog.apply(version, changed, deleted)
+
+    def reset(self):
+        """
+        Bump the version stamp after changes that can not be applied
+        in place, e.g. rows created without primary keys.
+        """
+        with self._lock:
+            self._catalog = None
+            bump_version(self.scope)
+
+
+ingredient_index = IngredientIndex()
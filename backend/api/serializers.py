@@ -1,11 +1,15 @@
+from collections import Counter
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            RecipeTag, ShoppingCart, Tag)
+from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
 from rest_framework import serializers
-from users.models import Subscription
+
+from .services import get_recipes_limit, recipe_amounts_changed
+from .viewer_state import get_viewer_state
 
 User = get_user_model()
 
@@ -29,9 +33,9 @@ class CustomUserSerializer(UserSerializer):
         user = self.context.get('request').user
         if user.is_anonymous or (user == obj):
             return False
-        return Subscription.objects.filter(
-            user=user, author=obj
-        ).exists()
+        return get_viewer_state(
+            self.context.get('request')
+        ).is_subscribed(obj.id)
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -118,20 +122,38 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         )
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Favorite.objects.filter(
-            user=user, recipe__id=obj.id
-        ).exists()
+        return get_viewer_state(
+            self.context.get('request')
+        ).is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(
-            user=user, recipe__id=obj.id
-        ).exists()
+        return get_viewer_state(
+            self.context.get('request')
+        ).is_in_shopping_cart(obj.id)
+
+
+class AuthorFragmentSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = User
+        fields = ('id', 'email', 'username', 'first_name', 'last_name')
+
+
+class RecipeFragmentSerializer(RecipeGetSerializer):
+    """
+    Part of RecipeGetSerializer that is the same for every viewer,
+    with a relative image URL.
+    """
+    is_favorited = None
+    is_in_shopping_cart = None
+    author = AuthorFragmentSerializer(read_only=True)
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'author', 'name', 'image', 'text', 'tags',
+            'ingredients', 'cooking_time'
+        )
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
@@ -147,10 +169,7 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
     ingredients = IngredientToRecipeSerializer(many=True)
     tags = serializers.ListField(
-        child=serializers.SlugRelatedField(
-            slug_field='id',
-            queryset=Tag.objects.all()
-        ),
+        child=serializers.IntegerField(),
         allow_empty=False
     )
 
@@ -161,46 +180,67 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             'tags', 'ingredients', 'cooking_time'
         )
 
+    @staticmethod
+    def resolve_ids(model, ids, label):
+        """
+        Fetch the objects for `ids` in one query. Return them in the
+        given order along with the errors for repeated and missing ids.
+        """
+        objects = model.objects.in_bulk(set(ids))
+        errors = []
+        repeated = [pk for pk, count in Counter(ids).items() if count > 1]
+        if repeated:
+            errors.append(f'You have repeated {label}: {repeated}')
+        missing = [pk for pk in dict.fromkeys(ids) if pk not in objects]
+        if missing:
+            errors.append(f'There are no {label} with id: {missing}')
+        return [objects[pk] for pk in ids if pk in objects], errors
+
     def validate(self, data):
-        if data['name'] == data['text']:
-            raise serializers.ValidationError(
+        errors = {}
+        if 'name' in data and data['name'] == data.get('text'):
+            errors['non_field_errors'] = [
                 'The value of "name" field could '
                 'not be the same as the value of "text" field.'
+            ]
+        if 'tags' in data:
+            data['tags'], tag_errors = self.resolve_ids(
+                Tag, data['tags'], 'tags'
             )
-        if not data['tags']:
-            raise serializers.ValidationError(
-                '"Tag" field must be filled out.'
-            )
-        tags_in_recipe = []
-        for tag in data['tags']:
-            if tag in tags_in_recipe:
-                raise serializers.ValidationError(
-                    f'You have repeated tags: {tag}'
+            if tag_errors:
+                errors['tags'] = tag_errors
+        if 'ingredients' in data:
+            ingredient_errors = []
+            if not data['ingredients']:
+                ingredient_errors.append(
+                    '"Ingredients" field must be filled out.'
                 )
-            tags_in_recipe.append(tag)
-        if not data['ingredients']:
-            raise serializers.ValidationError(
-                '"Ingredients" field must be filled out.'
+            if any(int(ing['amount']) <= 0 for ing in data['ingredients']):
+                ingredient_errors.append('Amount must be greater than 0')
+            ingredients, resolve_errors = self.resolve_ids(
+                Ingredient,
+                [ing['id'] for ing in data['ingredients']],
+                'ingredients'
             )
-        ing_in_recipe = []
-        for ing in data['ingredients']:
-            if int(ing['amount']) <= 0:
-                raise serializers.ValidationError(
-                    'Amount must be greater than 0'
-                )
-            ingredient = get_object_or_404(Ingredient, id=ing['id'])
-            if ingredient in ing_in_recipe:
-                raise serializers.ValidationError(
-                    f'You have repeated ingredients: {ingredient}'
-                )
-            ing_in_recipe.append(ingredient)
+            ingredient_errors.extend(resolve_errors)
+            if ingredient_errors:
+                errors['ingredients'] = ingredient_errors
+            else:
+                data['ingredients'] = [
+                    {'ingredient': ingredient, 'amount': ing['amount']}
+                    for ingredient, ing in zip(
+                        ingredients, data['ingredients']
+                    )
+                ]
+        if errors:
+            raise serializers.ValidationError(errors)
         return data
 
     @classmethod
     def recipe_ingredient_create(cls, recipe, ingredients):
         recipe_list = [RecipeIngredient(
             recipe=recipe,
-            ingredients=get_object_or_404(Ingredient, id=ingredient['id']),
+            ingredients=ingredient['ingredient'],
             amount=ingredient['amount']
         ) for ingredient in ingredients]
         RecipeIngredient.objects.bulk_create(recipe_list)
@@ -208,6 +248,54 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     def to_representation(self, value):
         return RecipeGetSerializer(value, context=self.context).data
 
+    @staticmethod
+    def update_tags(recipe, tags):
+        existing = dict(RecipeTag.objects.filter(
+            recipe=recipe
+        ).values_list('tag_id', 'id'))
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag)
+            for tag in tags if existing.pop(tag.id, None) is None
+        )
+        if existing:
+            RecipeTag.objects.filter(id__in=existing.values()).delete()
+
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """
+        Apply the difference between the stored and the new ingredients
+        and return the old and new `{ingredient_id: amount}`.
+        """
+        existing = {
+            item.ingredients_id: item
+            for item in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        old_amounts = {pk: item.amount for pk, item in existing.items()}
+        created, updated = [], []
+        for ingredient in ingredients:
+            item = existing.pop(ingredient['ingredient'].id, None)
+            if item is None:
+                created.append(RecipeIngredient(
+                    recipe=recipe,
+                    ingredients=ingredient['ingredient'],
+                    amount=ingredient['amount']
+                ))
+            elif item.amount != ingredient['amount']:
+                item.amount = ingredient['amount']
+                updated.append(item)
+        RecipeIngredient.objects.bulk_create(created)
+        RecipeIngredient.objects.bulk_update(updated, ['amount'])
+        if existing:
+            RecipeIngredient.objects.filter(
+                id__in=[item.id for item in existing.values()]
+            ).delete()
+        new_amounts = {
+            ingredient['ingredient'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        return old_amounts, new_amounts
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -222,9 +310,10 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         recipe.tags.set(tags)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = self.context['request'].data['ingredients']
-        tags = self.context['request'].data['tags']
+        ingredients = validated_data.get('ingredients')
+        tags = validated_data.get('tags')
         instance.name = validated_data.get('name', instance.name)
         instance.image = validated_data.get('image', instance.image)
         instance.text = validated_data.get('text', instance.text)
@@ -232,23 +321,18 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             'cooking_time', instance.cooking_time
         )
         instance.save()
-        if tags:
-            RecipeTag.objects.filter(recipe=instance).delete()
-            instance.tags.clear()
-            instance.tags.set(tags)
-        if ingredients:
-            RecipeIngredient.objects.filter(recipe=instance).delete()
-            instance.ingredients.clear()
-            self.recipe_ingredient_create(
-                recipe=instance,
-                ingredients=ingredients
+        if tags is not None:
+            self.update_tags(instance, tags)
+        if ingredients is not None:
+            recipe_amounts_changed(
+                instance, *self.update_ingredients(instance, ingredients)
             )
         return instance
 
 
 class SubscriptionSerializer(CustomUserSerializer):
-    recipes = RecipeShortSerializer(many=True, read_only=True)
-    recipes_count = serializers.SerializerMethodField()
+    recipes = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = User
@@ -263,5 +347,36 @@ class SubscriptionSerializer(CustomUserSerializer):
             'recipes_count',
         )
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+    def get_recipes(self, obj):
+        recipes = getattr(obj, 'latest_recipes', None)
+        if recipes is None:
+            recipes = obj.recipes.order_by('-pub_date', '-id')
+            limit = get_recipes_limit(self.context.get('request'))
+            if limit is not None:
+                recipes = recipes[:limit]
+        return RecipeShortSerializer(
+            recipes, many=True, context=self.context
+        ).data
+
+
+class BatchSerializer(serializers.Serializer):
+    add = serializers.ListField(
+        child=serializers.IntegerField(),
+        max_length=settings.BATCH_MAX_SIZE,
+        default=list
+    )
+    remove = serializers.ListField(
+        child=serializers.IntegerField(),
+        max_length=settings.BATCH_MAX_SIZE,
+        default=list
+    )
+
+    def validate(self, data):
+        data['add'] = list(dict.fromkeys(data['add']))
+        data['remove'] = list(dict.fromkeys(data['remove']))
+        both = sorted(set(data['add']) & set(data['remove']))
+        if both:
+            raise serializers.ValidationError(
+                f'You can not add and remove the same ids: {both}'
+            )
+        return data
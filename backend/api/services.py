@@ -1,35 +1,566 @@
-import logging
+import csv
+import io
+import json
+import os
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import chain
 
-from django.db.models import Sum
-from django.http import HttpResponse
-from recipes.models import RecipeIngredient
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
+from django.db.models import Count, F, OuterRef, QuerySet, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from recipes.models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                            ShoppingListItem)
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
 from rest_framework import status
 from rest_framework.response import Response
+from users.models import Subscription
 
+from .versions import get_version
 
-def download_cart(user):
-    if not user.is_in_shopping_cart.exists():
-        return Response(status=status.HTTP_400_BAD_REQUEST)
-    ingredients = RecipeIngredient.objects.filter(
-        recipe__is_in_shopping_cart__user=user
-    ).values(
-        'ingredients__name',
-        'ingredients__measurement_unit'
-    ).annotate(amount=Sum('amount'))
-    logging.error(ingredients)
-    filename = f'{user.username}_shopping_list.txt'
-    shopping_list = 'Shopping List\n\n'
-    for ingredient in ingredients:
-        name = ingredient['ingredients__name']
-        amount = ingredient['amount']
-        measurement_unit = ingredient['ingredients__measurement_unit']
-        shopping_list += (
-            f'{name}: {amount} {measurement_unit}\n'
-        )
-    response = HttpResponse(
-        content=shopping_list,
-        content_type='text.txt',
-        charset='utf-8'
+User = get_user_model()
+
+SHOPPING_LIST_TITLE = 'Shopping List'
+CHUNK_SIZE = 8192
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+# The target field of every relation model and the counter its rows
+# are kept in on the target.
+RELATIONS = {
+    Favorite: ('recipe_id', Recipe, 'favorites_count'),
+    ShoppingCart: ('recipe_id', Recipe, 'carts_count'),
+    Subscription: ('author_id', User, 'followers_count'),
+}
+
+ADDED = 'added'
+ALREADY_ADDED = 'already_added'
+REMOVED = 'removed'
+NOT_ADDED = 'not_added'
+NOT_FOUND = 'not_found'
+NOT_ALLOWED = 'not_allowed'
+
+
+def change_counters(model, pks, field, delta):
+    """
+    Atomically add `delta` to the counters of `pks`, a collection or
+    a subquery, never going below zero.
+    """
+    if not isinstance(pks, QuerySet) and not pks:
+        return
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def change_counter(model, pk, field, delta):
+    change_counters(model, [pk], field, delta)
+
+
+def change_relation_counter(model, pk, delta):
+    """
+    Add `delta` to the counter of the target `pk` of a `model` row.
+    """
+    _, target, counter = RELATIONS[model]
+    change_counter(target, pk, counter, delta)
+
+
+def insert_ignoring_conflicts_sql(connection, model, fields, count):
+    """
+    Return the statement inserting `count` rows of `fields` that skips
+    the rows breaking a unique constraint.
+    """
+    ops = connection.ops
+    columns = ', '.join(
+        ops.quote_name(model._meta.get_field(name).column) for name in fields
     )
+    row = '(%s)' % ', '.join(['%s'] * len(fields))
+    return ' '.join(filter(None, (
+        ops.insert_statement(ignore_conflicts=True),
+        ops.quote_name(model._meta.db_table),
+        f'({columns})',
+        'VALUES ' + ', '.join([row] * count),
+        ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+    )))
+
+
+def add_relation(model, **values):
+    """
+    Insert the row of `values`, keyed by attname, with one statement
+    that skips it if it breaks a unique constraint, and return whether
+    it was inserted.
+    """
+    connection = connections[router.db_for_write(model)]
+    fields = [model._meta.get_field(name) for name in values]
+    sql = insert_ignoring_conflicts_sql(connection, model, values, 1)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [
+            field.get_db_prep_save(value, connection)
+            for field, value in zip(fields, values.values())
+        ])
+        return cursor.rowcount > 0
+
+
+def remove_relation(model, **values):
+    """
+    Delete the row of `values` with one statement and return whether
+    it existed.
+    """
+    deleted, _ = model.objects.filter(**values).delete()
+    return deleted > 0
+
+
+def add_relations(model, field, user_id, pks):
+    """
+    Insert the rows of the user and every pk in `field` with one
+    statement and return the set of pks that were not there yet.
+
+    Databases that cannot return the inserted rows look them up first,
+    which relies on the transaction keeping them.
+    """
+    pks = set(pks)
+    if not pks:
+        return set()
+    connection = connections[router.db_for_write(model)]
+    returning = connection.features.can_return_ids_from_bulk_insert
+    if not returning:
+        pks -= set(model.objects.filter(
+            user_id=user_id, **{f'{field}__in': pks}
+        ).values_list(field, flat=True))
+        if not pks:
+            return set()
+    sql = insert_ignoring_conflicts_sql(
+        connection, model, ('user_id', field), len(pks)
+    )
+    if returning:
+        column = model._meta.get_field(field).column
+        sql += f' RETURNING {connection.ops.quote_name(column)}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [
+            value for pk in sorted(pks) for value in (user_id, pk)
+        ])
+        if returning:
+            return {row[0] for row in cursor.fetchall()}
+    return pks
+
+
+def remove_relations(model, field, user_id, pks):
+    """
+    Delete the rows of the user and every pk in `field` and return the
+    set of pks that were there. The rows are locked first, so
+    concurrent deletes do not count them twice.
+    """
+    if not pks:
+        return set()
+    removed = set(model.objects.select_for_update().filter(
+        user_id=user_id, **{f'{field}__in': pks}
+    ).values_list(field, flat=True))
+    if removed:
+        model.objects.filter(
+            user_id=user_id, **{f'{field}__in': removed}
+        ).delete()
+    return removed
+
+
+def cart_deltas(user, added, removed):
+    """
+    Return the shopping list deltas of adding and removing recipes
+    from the user's cart, read with one query.
+    """
+    deltas = {}
+    for recipe, ingredient, amount in RecipeIngredient.objects.filter(
+        recipe_id__in=added | removed
+    ).values_list('recipe_id', 'ingredients_id', 'amount'):
+        sign = 1 if recipe in added else -1
+        key = (user.id, ingredient)
+        deltas[key] = deltas.get(key, 0) + sign * amount
+    return deltas
+
+
+def batch_relations(model, user, add, remove):
+    """
+    Add and remove the user's `model` rows for the ids in `add` and
+    `remove` with set-based statements, updating the counters and the
+    shopping list once. Return the per-id results and whether anything
+    changed. Must run in a transaction.
+    """
+    field, target, counter = RELATIONS[model]
+    found = set(target.objects.filter(
+        pk__in={*add, *remove}
+    ).values_list('pk', flat=True))
+    allowed = found - {user.id} if model is Subscription else found
+    added = add_relations(model, field, user.id, allowed.intersection(add))
+    removed = remove_relations(
+        model, field, user.id, found.intersection(remove)
+    )
+    change_counters(target, added, counter, 1)
+    change_counters(target, removed, counter, -1)
+    if model is ShoppingCart and (added or removed):
+        update_shopping_lists(cart_deltas(user, added, removed))
+    results = {'add': [], 'remove': []}
+    for pk in add:
+        if pk not in found:
+            result = NOT_FOUND
+        elif pk not in allowed:
+            result = NOT_ALLOWED
+        else:
+            result = ADDED if pk in added else ALREADY_ADDED
+        results['add'].append({'id': pk, 'result': result})
+    for pk in remove:
+        if pk not in found:
+            result = NOT_FOUND
+        else:
+            result = REMOVED if pk in removed else NOT_ADDED
+        results['remove'].append({'id': pk, 'result': result})
+    return results, bool(added or removed)
+
+
+def reconcile_counters():
+    """
+    Recount every counter that drifted from its rows and return
+    `{'Model.field': number of fixed rows}`.
+    """
+    fixed = {}
+    for model, field, related_model, related_field in COUNTERS:
+        actual = Coalesce(Subquery(
+            related_model.objects.filter(
+                **{related_field: OuterRef('pk')}
+            ).order_by().values(related_field).annotate(
+                count=Count('pk')
+            ).values('count')
+        ), 0)
+        drifted = model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}
+        ).values_list('pk', flat=True)
+        fixed[f'{model.__name__}.{field}'] = model.objects.filter(
+            pk__in=list(drifted)
+        ).update(**{field: actual})
+    return fixed
+
+
+LATEST_RECIPES_SQL = """
+    SELECT id, author_id, name, image, cooking_time
+    FROM (
+        SELECT id, author_id, name, image, cooking_time, ROW_NUMBER() OVER (
+            PARTITION BY author_id ORDER BY pub_date DESC, id DESC
+        ) AS position
+        FROM {table}
+        WHERE author_id IN ({authors})
+    ) AS ranked
+    WHERE position <= %s
+    ORDER BY author_id, position
+"""
+
+
+def get_recipes_limit(request):
+    """
+    Return the positive `recipes_limit` query parameter or None.
+    """
+    try:
+        limit = int(request.query_params.get('recipes_limit', ''))
+    except ValueError:
+        return None
+    return limit if limit > 0 else None
+
+
+def prefetch_latest_recipes(authors, limit=None):
+    """
+    Attach the `limit` newest recipes of every author as
+    `latest_recipes`, fetching them with a single windowed query.
+    """
+    by_author = {}
+    for author in authors:
+        author.latest_recipes = []
+        by_author[author.id] = author
+    if not by_author:
+        return
+    if limit is None:
+        recipes = Recipe.objects.filter(
+            author_id__in=by_author
+        ).only(
+            'id', 'author_id', 'name', 'image', 'cooking_time'
+        ).order_by('author_id', '-pub_date', '-id')
+    else:
+        recipes = Recipe.objects.raw(LATEST_RECIPES_SQL.format(
+            table=Recipe._meta.db_table,
+            authors=', '.join(['%s'] * len(by_author))
+        ), [*by_author, limit])
+    for recipe in recipes:
+        by_author[recipe.author_id].latest_recipes.append(recipe)
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def author_changed_at(author_id):
+    """
+    Return when the author was last changed, which is the time held by
+    their version stamp, or None if they never were.
+    """
+    version = get_version(author_scope(author_id))
+    if not version:
+        return None
+    return datetime.fromtimestamp(version / 1000, timezone.utc)
+
+
+def recipe_updated_at(request, pk):
+    """
+    Return when the recipe or its embedded author was last changed.
+    """
+    try:
+        row = Recipe.objects.filter(pk=pk).values_list(
+            'updated_at', 'author_id'
+        ).first()
+    except (TypeError, ValueError):
+        return None
+    if row is None:
+        return None
+    updated_at, author_id = row
+    author_changed = author_changed_at(author_id)
+    if author_changed is None:
+        return updated_at
+    return max(updated_at, author_changed)
+
+
+def recipe_amounts(recipe):
+    """
+    Return `{ingredient_id: amount}` of the recipe.
+    """
+    return dict(RecipeIngredient.objects.filter(
+        recipe=recipe
+    ).values_list('ingredients_id', 'amount'))
+
+
+@transaction.atomic
+def update_shopping_lists(deltas):
+    """
+    Apply `{(user_id, ingredient_id): delta}` to the aggregated
+    shopping lists, dropping the items that reach zero.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # Lock the users first: items created by concurrent updates of the
+    # same list are not covered by the lock on the existing items.
+    list(User.objects.select_for_update().filter(
+        id__in={user for user, _ in deltas}
+    ).order_by('id').values_list('id', flat=True))
+    items = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.select_for_update().filter(
+            user_id__in={user for user, _ in deltas},
+            ingredient_id__in={ingredient for _, ingredient in deltas}
+        )
+    }
+    created, updated, deleted = [], [], []
+    for (user, ingredient), delta in deltas.items():
+        item = items.get((user, ingredient))
+        if item is None:
+            if delta > 0:
+                created.append(ShoppingListItem(
+                    user_id=user, ingredient_id=ingredient, amount=delta
+                ))
+            continue
+        item.amount += delta
+        if item.amount > 0:
+            updated.append(item)
+        else:
+            deleted.append(item.id)
+    ShoppingListItem.objects.bulk_create(created)
+    ShoppingListItem.objects.bulk_update(updated, ['amount'])
+    ShoppingListItem.objects.filter(id__in=deleted).delete()
+
+
+def add_to_shopping_list(user, recipe, sign=1):
+    update_shopping_lists({
+        (user.id, ingredient): sign * amount
+        for ingredient, amount in recipe_amounts(recipe).items()
+    })
+
+
+def remove_from_shopping_list(user, recipe):
+    add_to_shopping_list(user, recipe, sign=-1)
+
+
+def recipe_amounts_changed(recipe, old_amounts, new_amounts=None):
+    """
+    Move the shopping lists of everybody who has the recipe in the cart
+    from `old_amounts` to `new_amounts` (the current ones by default).
+    """
+    if new_amounts is None:
+        new_amounts = recipe_amounts(recipe)
+    changes = {
+        ingredient: new_amounts.get(ingredient, 0)
+        - old_amounts.get(ingredient, 0)
+        for ingredient in old_amounts.keys() | new_amounts.keys()
+    }
+    if not any(changes.values()):
+        return
+    users = ShoppingCart.objects.filter(
+        recipe=recipe
+    ).values_list('user_id', flat=True)
+    update_shopping_lists({
+        (user, ingredient): delta
+        for user in users
+        for ingredient, delta in changes.items()
+    })
+
+
+def expected_shopping_lists():
+    """
+    Aggregate `{(user_id, ingredient_id): amount}` from the carts.
+    """
+    return {
+        (user, ingredient): amount
+        for user, ingredient, amount in RecipeIngredient.objects.filter(
+            recipe__is_in_shopping_cart__isnull=False
+        ).values_list(
+            'recipe__is_in_shopping_cart__user', 'ingredients'
+        ).annotate(amount=Sum('amount')).order_by().iterator()
+    }
+
+
+def shopping_list_rows(user):
+    """
+    Iterate over `(name, measurement_unit, amount)` of the user's
+    shopping list without loading it into memory.
+    """
+    return ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'amount'
+    ).order_by('ingredient__name').iterator()
+
+
+def chunked(parts, size=CHUNK_SIZE):
+    """
+    Join small string parts into chunks of about `size` bytes.
+    """
+    buffer, length = [], 0
+    for part in parts:
+        buffer.append(part)
+        length += len(part)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def encoded(export):
+    """
+    Turn an exporter producing text into one producing UTF-8 chunks.
+    """
+    def wrapper(rows):
+        return (chunk.encode('utf-8') for chunk in chunked(export(rows)))
+    return wrapper
+
+
+class Echo:
+    """
+    File-like object that returns what is written to it,
+    so csv.writer can produce rows one by one.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_txt(rows):
+    yield f'{SHOPPING_LIST_TITLE}\n\n'
+    for name, measurement_unit, amount in rows:
+        yield f'{name}: {amount} {measurement_unit}\n'
+
+
+def export_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for name, measurement_unit, amount in rows:
+        yield writer.writerow((name, amount, measurement_unit))
+
+
+def export_json(rows):
+    separator = ''
+    yield '['
+    for name, measurement_unit, amount in rows:
+        yield separator + json.dumps({
+            'name': name,
+            'measurement_unit': measurement_unit,
+            'amount': amount,
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+@lru_cache(maxsize=None)
+def pdf_font():
+    font_path = settings.SHOPPING_LIST_PDF_FONT
+    if not font_path or not os.path.exists(font_path):
+        return 'Helvetica'
+    pdfmetrics.registerFont(TTFont('ShoppingListFont', font_path))
+    return 'ShoppingListFont'
+
+
+def export_pdf(rows, font_size=12, margin=50):
+    """
+    Render the list with reportlab, which writes the document only
+    when it is saved, so the file is streamed after it is built.
+    """
+    buffer = io.BytesIO()
+    document = canvas.Canvas(buffer, pagesize=A4)
+    font = pdf_font()
+    _, height = A4
+    line_height = font_size * 1.5
+    document.setFont(font, font_size * 1.5)
+    document.drawString(margin, height - margin, SHOPPING_LIST_TITLE)
+    document.setFont(font, font_size)
+    y = height - margin - line_height * 2
+    for name, measurement_unit, amount in rows:
+        if y < margin:
+            document.showPage()
+            document.setFont(font, font_size)
+            y = height - margin
+        document.drawString(
+            margin, y, f'{name}: {amount} {measurement_unit}'
+        )
+        y -= line_height
+    document.save()
+    buffer.seek(0)
+    return iter(lambda: buffer.read(CHUNK_SIZE), b'')
+
+
+EXPORT_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', encoded(export_txt)),
+    'csv': ('text/csv; charset=utf-8', encoded(export_csv)),
+    'json': ('application/json', encoded(export_json)),
+    'pdf': ('application/pdf', export_pdf),
+}
+
+
+def download_cart(user, export_format='txt'):
+    # The shopping list is empty exactly when the cart is, so the first
+    # row tells whether there is anything to download.
+    rows = shopping_list_rows(user)
+    first = next(rows, None)
+    if first is None:
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+    content_type, export = EXPORT_FORMATS[export_format]
+    content = export(chain([first], rows))
+    filename = f'{user.username}_shopping_list.{export_format}'
+    response = StreamingHttpResponse(content, content_type=content_type)
     response['Content-Disposition'] = f'attachment; filename={filename}'
     return response
@@ -0,0 +1,98 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens
+from .cache import bump_on_commit
+from .search import ingredient_index
+from .services import (RELATIONS, author_scope, change_counter,
+                       change_counters, recipe_amounts, recipe_amounts_changed)
+from .versions import touch_version
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: ingredient_index.invalidate(changed=[instance])
+    )
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: ingredient_index.invalidate(deleted=[instance])
+    )
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    recipe_amounts_changed(instance, recipe_amounts(instance), {})
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def recipes_changed(sender, **kwargs):
+    bump_on_commit('recipes')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump_on_commit('tags', 'recipes')
+
+
+@receiver(post_save, sender=User)
+def author_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    keys = list(Token.objects.filter(
+        user=instance
+    ).values_list('key', flat=True))
+    transaction.on_commit(lambda: invalidate_tokens(*keys))
+    # The counter of the instance may be older than its recipes.
+    if Recipe.objects.filter(author=instance).exists():
+        # Recipes embed their author, so their fragments and validators
+        # include the author stamp.
+        transaction.on_commit(
+            lambda: touch_version(author_scope(instance.id))
+        )
+        bump_on_commit('recipes')
+
+
+@receiver(pre_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    # The favorites, cart items and subscriptions of the user cascade
+    # away with it, so take them out of the counters they were in.
+    for model, (field, target, counter) in RELATIONS.items():
+        change_counters(
+            target, model.objects.filter(user=instance).values(field),
+            counter, -1
+        )
+
+
+@receiver(post_delete, sender=User)
+def author_deleted(sender, **kwargs):
+    bump_on_commit('recipes')
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_tokens(instance.key))
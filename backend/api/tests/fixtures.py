@@ -0,0 +1,119 @@
+import logging
+
+from api.authentication import token_cache
+from api.search import ingredient_index
+from api.services import (expected_shopping_lists, reconcile_counters,
+                          update_shopping_lists)
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag)
+from rest_framework.authtoken.models import Token
+from users.models import Subscription
+
+User = get_user_model()
+
+# Tests run with their own cache, so clearing it never touches the
+# cache of a running site.
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    }
+}
+
+TAGS = 3
+INGREDIENTS_PER_RECIPE = 3
+TAGS_PER_RECIPE = 2
+
+
+def created(model, objects):
+    """
+    Insert `objects` into the empty table and return them with their
+    primary keys, which bulk_create sets only on PostgreSQL.
+    """
+    model.objects.bulk_create(objects)
+    return list(model.objects.order_by('id'))
+
+
+def seed(authors, recipes, ingredients):
+    """
+    Create a viewer and `authors` authors with `recipes` recipes each,
+    sharing `ingredients` ingredients and TAGS tags in turn.
+    Return the viewer, the authors and the recipes.
+    """
+    tags = created(Tag, (
+        Tag(name=f'tag {i}', color=f'#{i:06d}', slug=f'tag-{i}')
+        for i in range(TAGS)
+    ))
+    ingredients = created(Ingredient, (
+        Ingredient(name=f'ingredient {i}', measurement_unit='g')
+        for i in range(ingredients)
+    ))
+    viewer, *authors = created(User, (
+        User(
+            username=f'user{i}', email=f'user{i}@example.com',
+            first_name='First', last_name='Last'
+        )
+        for i in range(authors + 1)
+    ))
+    recipes = created(Recipe, (
+        Recipe(
+            author=author, name=f'recipe {i}', text='text',
+            image='recipes/image.png', cooking_time=10
+        )
+        for author in authors for i in range(recipes)
+    ))
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            recipe=recipe, amount=i + 1,
+            ingredients=ingredients[(n + i) % len(ingredients)]
+        )
+        for n, recipe in enumerate(recipes)
+        for i in range(INGREDIENTS_PER_RECIPE)
+    )
+    RecipeTag.objects.bulk_create(
+        RecipeTag(recipe=recipe, tag=tags[(n + i) % len(tags)])
+        for n, recipe in enumerate(recipes)
+        for i in range(TAGS_PER_RECIPE)
+    )
+    reconcile_counters()
+    return viewer, authors, recipes
+
+
+def follow_all(viewer, authors, recipes):
+    """
+    Subscribe the viewer to `authors` and put `recipes` into their
+    favorites and shopping cart.
+    """
+    Subscription.objects.bulk_create(
+        Subscription(user=viewer, author=author) for author in authors
+    )
+    for model in (Favorite, ShoppingCart):
+        model.objects.bulk_create(
+            model(user=viewer, recipe=recipe) for recipe in recipes
+        )
+    reconcile_counters()
+    update_shopping_lists(expected_shopping_lists())
+
+
+def token_for(user):
+    return Token.objects.create(user=user).key
+
+
+def silence_timing_log(test):
+    """
+    Keep the log line of every request out of the output of `test`.
+    """
+    logger = logging.getLogger('api.timing')
+    test.addCleanup(logger.setLevel, logger.level)
+    logger.setLevel(logging.WARNING)
+
+
+def reset_caches():
+    """
+    Forget everything cached, so the next request runs every query.
+    """
+    cache.clear()
+    token_cache.clear()
+    ingredient_index.reset()
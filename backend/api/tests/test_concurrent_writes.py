@@ -0,0 +1,117 @@
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from unittest import SkipTest
+
+from api.services import expected_shopping_lists, reconcile_counters
+from django.db import connection, connections
+from django.test import Client, TransactionTestCase, override_settings
+from recipes.models import ShoppingListItem
+
+from .fixtures import (LOCMEM_CACHES, reset_caches, seed, silence_timing_log,
+                       token_for)
+
+THREADS = 8
+ROUNDS = 3
+RECIPES = 4
+INGREDIENTS = 6
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConcurrentWritesTests(TransactionTestCase):
+    """
+    Concurrent favorite, shopping cart and subscription writes give one
+    success per change, no errors and consistent counters and shopping
+    lists.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # Threads share an in-memory SQLite database through a shared
+        # cache, whose table locks fail instead of waiting. The settings
+        # give SQLite a test database file for that.
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise SkipTest('Needs a database file or server.')
+        super().setUpClass()
+
+    def setUp(self):
+        silence_timing_log(self)
+        reset_caches()
+        viewer, (self.author,), self.recipes = seed(1, RECIPES, INGREDIENTS)
+        self.token = token_for(viewer)
+
+    def hammer(self, method, urls):
+        """
+        Send the requests from one thread per url, released together,
+        and return the Counter of the response statuses.
+        """
+        barrier = threading.Barrier(len(urls))
+
+        def send(url):
+            client = Client()
+            try:
+                barrier.wait()
+                try:
+                    response = getattr(client, method)(
+                        url, HTTP_AUTHORIZATION=f'Token {self.token}'
+                    )
+                except Exception:
+                    # The test client re-raises errors of the view.
+                    return 500
+                return response.status_code
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(len(urls)) as executor:
+            return Counter(executor.map(send, urls))
+
+    def assert_consistent(self):
+        self.assertEqual(
+            {counter: 0 for counter in reconcile_counters()},
+            reconcile_counters()
+        )
+        self.assertEqual(
+            {
+                (user, ingredient): amount
+                for user, ingredient, amount
+                in ShoppingListItem.objects.values_list(
+                    'user_id', 'ingredient_id', 'amount'
+                )
+            },
+            expected_shopping_lists()
+        )
+
+    def assert_one_success_per_change(self, urls, changes):
+        for _ in range(ROUNDS):
+            for method, success in (('post', 201), ('delete', 204)):
+                statuses = self.hammer(method, urls)
+                self.assertEqual(
+                    +Counter({success: changes, 400: len(urls) - changes}),
+                    statuses, method
+                )
+                self.assert_consistent()
+
+    def test_duplicate_favorite(self):
+        self.assert_one_success_per_change(
+            [f'/api/recipes/{self.recipes[0].id}/favorite/'] * THREADS, 1
+        )
+
+    def test_duplicate_shopping_cart(self):
+        self.assert_one_success_per_change(
+            [f'/api/recipes/{self.recipes[0].id}/shopping_cart/'] * THREADS,
+            1
+        )
+
+    def test_duplicate_subscribe(self):
+        self.assert_one_success_per_change(
+            [f'/api/users/{self.author.id}/subscribe/'] * THREADS, 1
+        )
+
+    def test_parallel_shopping_cart(self):
+        self.assert_one_success_per_change(
+            [
+                f'/api/recipes/{self.recipes[i % RECIPES].id}/shopping_cart/'
+                for i in range(THREADS)
+            ],
+            RECIPES
+        )
@@ -0,0 +1,83 @@
+from collections import Counter
+
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .fixtures import (INGREDIENTS_PER_RECIPE, LOCMEM_CACHES, follow_all,
+                       reset_caches, seed, silence_timing_log, token_for)
+
+SMALL, LARGE = 2, 6
+
+SCENARIOS = (
+    ('recipes', '/api/recipes/?limit=1000', False),
+    ('recipes, keyset', '/api/recipes/?limit=1000&cursor=', False),
+    ('recipes, authenticated', '/api/recipes/?limit=1000', True),
+    ('recipe', '/api/recipes/{recipe}/', True),
+    ('favorited recipes', '/api/recipes/?limit=1000&is_favorited=1', True),
+    ('tags', '/api/tags/', False),
+    ('ingredients', '/api/ingredients/', False),
+    ('ingredients by name', '/api/ingredients/?name=ingredient', False),
+    ('users', '/api/users/?limit=1000', True),
+    (
+        'subscriptions',
+        '/api/users/subscriptions/?limit=1000&recipes_limit=3', True
+    ),
+    (
+        'subscriptions, all recipes',
+        '/api/users/subscriptions/?limit=1000', True
+    ),
+    ('download shopping cart', '/api/recipes/download_shopping_cart/', True),
+)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QueryBudgetTests(TestCase):
+    """
+    The number of queries of every endpoint does not grow with
+    the amount of data.
+    """
+
+    def setUp(self):
+        silence_timing_log(self)
+
+    def measure(self, size):
+        """
+        Request every scenario with cold caches on a dataset of `size`
+        authors with `size` recipes each, which is rolled back after.
+        Return `{scenario: Counter of statements}`.
+        """
+        statements = {}
+        with transaction.atomic():
+            viewer, authors, recipes = seed(
+                size, size, size * INGREDIENTS_PER_RECIPE
+            )
+            follow_all(viewer, authors, recipes)
+            token = token_for(viewer)
+            for name, url, authenticated in SCENARIOS:
+                reset_caches()
+                headers = {}
+                if authenticated:
+                    headers['HTTP_AUTHORIZATION'] = f'Token {token}'
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(
+                        url.format(recipe=recipes[0].id), **headers
+                    )
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.assertEqual(response.status_code, 200, name)
+                statements[name] = Counter(
+                    query['sql'] for query in queries.captured_queries
+                )
+            transaction.set_rollback(True)
+        return statements
+
+    def test_query_count_does_not_grow_with_data(self):
+        small, large = self.measure(SMALL), self.measure(LARGE)
+        for name, *_ in SCENARIOS:
+            with self.subTest(name):
+                before, after = small[name], large[name]
+                self.assertEqual(
+                    sum(before.values()), sum(after.values()),
+                    [sql for sql in after if after[sql] > before[sql]]
+                )
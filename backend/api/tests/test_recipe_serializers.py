@@ -0,0 +1,51 @@
+from api.management.commands.compare_recipe_serializers import (
+    serializer_data, values_data)
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase, override_settings
+from recipes.models import Favorite, Recipe, ShoppingCart
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from users.models import Subscription
+
+from .fixtures import LOCMEM_CACHES, seed
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecipeSerializersTests(TestCase):
+    """
+    The values-based recipe fragments render the same JSON as
+    RecipeGetSerializer.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer, authors, recipes = seed(3, 3, 5)
+        Subscription.objects.create(user=cls.viewer, author=authors[0])
+        Favorite.objects.create(user=cls.viewer, recipe=recipes[0])
+        ShoppingCart.objects.create(user=cls.viewer, recipe=recipes[1])
+        # A recipe of the viewer, who can not follow themselves.
+        Recipe.objects.create(
+            author=cls.viewer, name='own recipe', text='text',
+            image='recipes/image.png', cooking_time=5
+        )
+
+    def assert_same_json(self, user):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        recipes = list(Recipe.objects.order_by('-pub_date', '-id').only(
+            'id', 'updated_at'
+        ))
+        render = JSONRenderer().render
+        expected = serializer_data(recipes, request)
+        actual = values_data(recipes, request)
+        self.assertEqual(len(actual), len(recipes))
+        for recipe, left, right in zip(recipes, expected, actual):
+            with self.subTest(recipe=recipe.id):
+                self.assertEqual(render(right), render(left))
+
+    def test_anonymous(self):
+        self.assert_same_json(AnonymousUser())
+
+    def test_viewer(self):
+        self.assert_same_json(self.viewer)
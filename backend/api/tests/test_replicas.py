@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from foodgram.routers import ReplicaMiddleware, ReplicaRouter, primary_reads
+from recipes.models import Recipe
+
+from .fixtures import LOCMEM_CACHES
+
+SQLITE = 'django.db.backends.sqlite3'
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReplicaRouterTests(SimpleTestCase):
+    """
+    Safe requests read from a healthy replica, unless the client wrote
+    something within REPLICA_PIN_TIMEOUT seconds.
+    """
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.connections = ConnectionHandler({
+            'default': {
+                'ENGINE': SQLITE,
+                'NAME': os.path.join(directory, 'primary.sqlite3'),
+            },
+            'replica': {
+                'ENGINE': SQLITE,
+                'NAME': os.path.join(directory, 'replica.sqlite3'),
+                'TEST': {'MIRROR': 'default'},
+            },
+            # SQLite can not create a file in a missing directory.
+            'down': {
+                'ENGINE': SQLITE,
+                'NAME': os.path.join(directory, 'missing', 'db.sqlite3'),
+                'TEST': {'MIRROR': 'default'},
+            },
+        })
+        self.addCleanup(self.connections.close_all)
+        self.replicas = ['replica']
+        for name, value in (
+            ('connections', self.connections),
+            ('replica_aliases', lambda: self.replicas),
+        ):
+            patcher = mock.patch(f'foodgram.routers.{name}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.router = ReplicaRouter()
+        cache.clear()
+
+    def read_alias(self, method='get', token=None):
+        """
+        Send a request through ReplicaMiddleware and return the alias
+        the router reads from while the view runs.
+        """
+        aliases = []
+
+        def view(request):
+            aliases.append(self.router.db_for_read(Recipe))
+            return HttpResponse()
+
+        headers = {}
+        if token:
+            headers['HTTP_AUTHORIZATION'] = f'Token {token}'
+        request = getattr(RequestFactory(), method)('/api/', **headers)
+        ReplicaMiddleware(view)(request)
+        return aliases[0]
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.read_alias(), 'replica')
+        self.assertEqual(self.read_alias(token='a'), 'replica')
+
+    def test_writes_go_to_primary(self):
+        self.assertEqual(self.read_alias('post', token='a'), 'default')
+        self.assertEqual(self.router.db_for_write(Recipe), 'default')
+
+    def test_client_reads_primary_after_write(self):
+        self.read_alias('post', token='a')
+        self.assertEqual(self.read_alias(token='a'), 'default')
+        self.assertEqual(self.read_alias(token='b'), 'replica')
+        self.assertEqual(self.read_alias(), 'replica')
+
+    def test_pin_expires(self):
+        with override_settings(REPLICA_PIN_TIMEOUT=0):
+            self.read_alias('post', token='a')
+        self.assertEqual(self.read_alias(token='a'), 'replica')
+
+    def test_replica_down_is_skipped(self):
+        self.replicas = ['down', 'replica']
+        for _ in range(3):
+            self.assertEqual(self.read_alias(), 'replica')
+
+    def test_primary_when_every_replica_is_down(self):
+        self.replicas = ['down']
+        self.assertEqual(self.read_alias(), 'default')
+
+    def test_primary_reads(self):
+        aliases = []
+
+        def view(request):
+            with primary_reads():
+                aliases.append(self.router.db_for_read(Recipe))
+            aliases.append(self.router.db_for_read(Recipe))
+            return HttpResponse()
+
+        ReplicaMiddleware(view)(RequestFactory().get('/api/'))
+        self.assertEqual(aliases, ['default', 'replica'])
@@ -0,0 +1,147 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """
+    Execute wrapper counting the queries and the time spent in them.
+    With `collect_sql` it also counts every distinct statement.
+    """
+
+    def __init__(self, collect_sql=False):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter() if collect_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            if self.statements is not None:
+                self.statements[sql] += 1
+
+
+@contextmanager
+def timed(request, phase):
+    """
+    Add the time spent within, less the time spent in the database,
+    to `phase` of the Server-Timing of `request`.
+    """
+    timing = getattr(request, '_timing', None)
+    if timing is None:
+        yield
+        return
+    recorder = timing['recorder']
+    db = recorder.duration
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing[phase] += (
+            time.perf_counter() - start - (recorder.duration - db)
+        )
+
+
+def view_name(view_func, method):
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__qualname__}'
+    action = (getattr(view_func, 'actions', None) or {}).get(method.lower())
+    return f'{cls.__name__}.{action}' if action else cls.__name__
+
+
+class ServerTimingMiddleware:
+    """
+    Report the number of queries, the time spent in the database,
+    in the application, in serialization and in rendering as
+    a `Server-Timing` header and a JSON log line.
+
+    Serialization counts the code wrapped in `timed(request,
+    'serialize')`, which excludes the queries it makes.
+
+    With SQL_DUPLICATE_THRESHOLD set, statements executed at least
+    that many times in one request are logged as a warning.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = settings.SQL_DUPLICATE_THRESHOLD
+        recorder = QueryRecorder(collect_sql=threshold is not None)
+        request._timing = {
+            'view': None, 'recorder': recorder,
+            'serialize': 0.0, 'render': 0.0,
+        }
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        timing = request._timing
+        app = (
+            total - recorder.duration - timing['serialize'] - timing['render']
+        )
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={recorder.duration * 1000:.1f};'
+            f'desc="{recorder.count} queries"',
+            f'app;dur={app * 1000:.1f}',
+            f'serialize;dur={timing["serialize"] * 1000:.1f}',
+            f'render;dur={timing["render"] * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+        logger.info(json.dumps({
+            'view': timing['view'],
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 1),
+            'app_ms': round(app * 1000, 1),
+            'serialize_ms': round(timing['serialize'] * 1000, 1),
+            'render_ms': round(timing['render'] * 1000, 1),
+            'total_ms': round(total * 1000, 1),
+        }))
+        if recorder.statements:
+            self.log_duplicates(request, recorder.statements, threshold)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timing['view'] = view_name(view_func, request.method)
+
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+
+        def rendered(response):
+            request._timing['render'] = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def log_duplicates(request, statements, threshold):
+        duplicates = [
+            (count, sql) for sql, count in statements.most_common()
+            if count >= threshold
+        ]
+        if not duplicates:
+            return
+        logger.warning(json.dumps({
+            'view': request._timing['view'],
+            'path': request.path,
+            'duplicates': [
+                {'count': count, 'sql': sql} for count, sql in duplicates
+            ],
+        }))
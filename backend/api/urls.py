@@ -2,7 +2,7 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (CustomUserViewSet, IngredientViewSet, RecipeViewSet,
-                    TagViewSet)
+                    ResponseCacheStatsView, TagViewSet)
 
 app_name = 'api'
 
@@ -16,6 +16,11 @@ subscriptions = CustomUserViewSet.as_view({'get': 'subscriptions', })
 
 urlpatterns = (
     path('users/subscriptions/', subscriptions, name='subscriptions'),
+    path(
+        'cache/stats/',
+        ResponseCacheStatsView.as_view(),
+        name='response-cache-stats'
+    ),
     path('auth/', include('djoser.urls.authtoken')),
     path('', include('djoser.urls')),
     path('', include(router.urls)),
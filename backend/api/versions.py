@@ -0,0 +1,104 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import VersionStamp
+
+VERSION_KEY = 'version:{scope}'
+
+
+def _initial_version():
+    # Start from a timestamp, so a scope never restarts from a value
+    # a cache built on an older database has already seen.
+    return int(time.time() * 1000)
+
+
+def _stamps():
+    # Stamps are read where they are written, as a lagging replica
+    # would hand out old versions for data that has changed.
+    return VersionStamp.objects.db_manager(router.db_for_write(VersionStamp))
+
+
+def _load(scopes):
+    """
+    Read the stamps of `scopes` from the database into the cache and
+    return them. Scopes never bumped have version 0.
+    """
+    versions = dict.fromkeys(scopes, 0)
+    versions.update(
+        _stamps().filter(scope__in=scopes).values_list('scope', 'version')
+    )
+    for scope, version in versions.items():
+        # add() keeps a version a concurrent bump has just stored.
+        cache.add(
+            VERSION_KEY.format(scope=scope), version, settings.VERSION_TIMEOUT
+        )
+    return versions
+
+
+def get_version(scope):
+    """
+    Return the current version stamp of `scope`.
+
+    With a process-local cache the stamp expires after VERSION_TIMEOUT
+    seconds and is read again from the database, so bumps made by other
+    processes are seen at the latest then.
+    """
+    version = cache.get(VERSION_KEY.format(scope=scope))
+    if version is not None:
+        return version
+    return _load([scope])[scope]
+
+
+def get_versions(scopes):
+    """
+    Return `{scope: version stamp}` of `scopes` with one cache round
+    trip and at most one query.
+    """
+    keys = {scope: VERSION_KEY.format(scope=scope) for scope in scopes}
+    found = cache.get_many(keys.values())
+    versions = {
+        scope: found[key] for scope, key in keys.items() if key in found
+    }
+    missing = [scope for scope in keys if scope not in versions]
+    if missing:
+        versions.update(_load(missing))
+    return versions
+
+
+def _change(scope, version):
+    """
+    Store the stamp of `scope` as the expression `version` of its
+    current value, or as the initial version if there is none yet.
+    """
+    stamps = _stamps().filter(scope=scope)
+    if not stamps.update(version=version):
+        _, created = _stamps().get_or_create(
+            scope=scope, defaults={'version': _initial_version()}
+        )
+        if not created:
+            stamps.update(version=version)
+    version = stamps.values_list('version', flat=True).get()
+    cache.set(
+        VERSION_KEY.format(scope=scope), version, settings.VERSION_TIMEOUT
+    )
+    return version
+
+
+def touch_version(scope):
+    """
+    Move the version stamp of `scope` to the current time in
+    milliseconds, so the stamp also tells when `scope` last changed.
+    """
+    return _change(scope, Greatest(F('version') + 1, _initial_version()))
+
+
+def bump_version(scope):
+    """
+    Invalidate everything built for `scope` and return the new version.
+    """
+    return _change(scope, F('version') + 1)
@@ -0,0 +1,109 @@
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from foodgram.routers import primary_reads
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+from .versions import bump_version, get_version
+
+VIEWER_STATE_KEY = 'viewer-state:{user}:{version}'
+
+
+def contains(ids, pk):
+    position = bisect_left(ids, pk)
+    return position < len(ids) and ids[position] == pk
+
+
+def sorted_ids(queryset, field):
+    return array('q', queryset.order_by(field).values_list(field, flat=True))
+
+
+class ViewerState:
+    """
+    Ids of the recipes a user has favorited or put into the shopping
+    cart and of the authors they follow, kept as sorted arrays.
+    """
+
+    def __init__(self, favorites=(), cart=(), following=()):
+        self.favorites = array('q', favorites)
+        self.cart = array('q', cart)
+        self.following = array('q', following)
+
+    @classmethod
+    def load(cls, user):
+        # The state is cached under the viewer stamp, so it must not
+        # come from a replica that has not caught up with the bump.
+        with primary_reads():
+            return cls(
+                sorted_ids(Favorite.objects.filter(user=user), 'recipe_id'),
+                sorted_ids(
+                    ShoppingCart.objects.filter(user=user), 'recipe_id'
+                ),
+                sorted_ids(
+                    Subscription.objects.filter(user=user), 'author_id'
+                ),
+            )
+
+    @classmethod
+    def get(cls, user):
+        key = VIEWER_STATE_KEY.format(
+            user=user.id, version=get_version(f'viewer:{user.id}')
+        )
+        cached = cache.get(key)
+        if cached is not None:
+            state = cls()
+            for ids, data in zip(
+                (state.favorites, state.cart, state.following), cached
+            ):
+                ids.frombytes(data)
+            return state
+        state = cls.load(user)
+        cache.set(key, (
+            state.favorites.tobytes(),
+            state.cart.tobytes(),
+            state.following.tobytes(),
+        ), settings.VIEWER_STATE_TIMEOUT)
+        return state
+
+    def is_favorited(self, recipe_id):
+        return contains(self.favorites, recipe_id)
+
+    def is_in_shopping_cart(self, recipe_id):
+        return contains(self.cart, recipe_id)
+
+    def is_subscribed(self, author_id):
+        return contains(self.following, author_id)
+
+
+ANONYMOUS_STATE = ViewerState()
+
+
+def get_viewer_state(request):
+    """
+    Return the viewer state of the request user, loading it once
+    per request.
+    """
+    user = request.user
+    if user.is_anonymous:
+        return ANONYMOUS_STATE
+    if getattr(request, '_viewer_state', None) is None:
+        request._viewer_state = ViewerState.get(user)
+    return request._viewer_state
+
+
+def invalidate_viewer_state(request):
+    """
+    Drop the viewer state of the request user once the current
+    transaction commits.
+    """
+    user_id = request.user.id
+
+    def invalidate():
+        bump_version(f'viewer:{user_id}')
+        request._viewer_state = None
+
+    transaction.on_commit(invalidate)
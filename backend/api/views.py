@@ -1,47 +1,104 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import (SAFE_METHODS, AllowAny,
-                                        IsAuthenticated,
+                                        IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from users.models import Subscription
 
-from .filters import IngredientFilter, RecipeFilter
-from .paginators import PageLimitPagination
+from .cache import cache_anonymous, conditional, response_cache_stats
+from .filters import RecipeFilter
+from .fragments import recipe_fragments, render_recipes
+from .paginators import PageLimitOrKeysetPagination
 from .permissions import AuthorOrReadOnly
-from .serializers import (CustomUserCreateSerializer, CustomUserSerializer,
-                          IngredientSerializer, RecipeCreateUpdateSerializer,
-                          RecipeGetSerializer, RecipeShortSerializer,
-                          SubscriptionSerializer, TagSerializer)
-from .services import download_cart
+from .renderers import (ShoppingListCSVRenderer, ShoppingListJSONRenderer,
+                        ShoppingListPDFRenderer, ShoppingListTextRenderer)
+from .search import ingredient_index
+from .serializers import (BatchSerializer, CustomUserCreateSerializer,
+                          CustomUserSerializer, IngredientSerializer,
+                          RecipeCreateUpdateSerializer, RecipeGetSerializer,
+                          RecipeShortSerializer, SubscriptionSerializer,
+                          TagSerializer)
+from .services import (add_relation, add_to_shopping_list, batch_relations,
+                       change_relation_counter, download_cart,
+                       get_recipes_limit, prefetch_latest_recipes,
+                       recipe_updated_at, remove_relation)
+from .timing import timed
+from .viewer_state import invalidate_viewer_state
 
 User = get_user_model()
 
 
+def change_in_batch(model, request):
+    """
+    Add and remove the ids listed in the request in one transaction
+    and return the result for every id.
+    """
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    with transaction.atomic():
+        results, changed = batch_relations(
+            model, request.user, **serializer.validated_data
+        )
+        if changed:
+            invalidate_viewer_state(request)
+    return Response(results)
+
+
 class TagViewSet(ReadOnlyModelViewSet):
     queryset = Tag.objects.all().order_by('name')
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
     pagination_class = None
 
+    @conditional('tags')
+    @cache_anonymous('tags')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional('tags')
+    @cache_anonymous('tags')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class IngredientViewSet(ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all().order_by('name')
     serializer_class = IngredientSerializer
     permission_classes = [AllowAny]
-    filter_backends = (IngredientFilter,)
-    search_fields = ('^name',)
     pagination_class = None
 
+    @conditional('ingredients')
+    @cache_anonymous('ingredients')
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name', '')
+        if name and request.query_params.get('fuzzy') in ('1', 'true'):
+            ingredients = ingredient_index.fuzzy_search(name)
+        else:
+            ingredients = ingredient_index.search(name)
+        serializer = self.get_serializer(ingredients, many=True)
+        with timed(request, 'serialize'):
+            data = serializer.data
+        return Response(data)
+
+    @conditional('ingredients')
+    @cache_anonymous('ingredients')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class CustomUserViewSet(UserViewSet):
-    pagination_class = PageLimitPagination
+    pagination_class = PageLimitOrKeysetPagination
+    cursor_ordering = ('username', 'id')
     queryset = User.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly]
     lookup_field = 'id'
@@ -61,17 +118,20 @@ class CustomUserViewSet(UserViewSet):
         user = request.user
         author_id = kwargs.get('id')
         author = get_object_or_404(User, id=author_id)
-        subscription = Subscription.objects.filter(
-            user=user,
-            author=author
-        )
         if request.method == 'POST':
             if user == author:
                 return Response(
                     {'errors': 'It\'s not allowed to subscribe to yourself.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            if subscription.exists():
+            with transaction.atomic():
+                subscribed = add_relation(
+                    Subscription, user_id=user.id, author_id=author.id
+                )
+                if subscribed:
+                    change_relation_counter(Subscription, author.pk, 1)
+                    invalidate_viewer_state(request)
+            if not subscribed:
                 return Response(
                     {'errors': 'You are already subscribed to the user'},
                     status=status.HTTP_400_BAD_REQUEST
@@ -80,20 +140,32 @@ class CustomUserViewSet(UserViewSet):
                 author,
                 context={'request': request},
             )
-            Subscription.objects.create(
-                user=user, author=author
-            )
             return Response(
                 serializer.data, status=status.HTTP_201_CREATED
             )
-        if not subscription.exists():
+        with transaction.atomic():
+            unsubscribed = remove_relation(
+                Subscription, user_id=user.id, author_id=author.id
+            )
+            if unsubscribed:
+                change_relation_counter(Subscription, author.pk, -1)
+                invalidate_viewer_state(request)
+        if not unsubscribed:
             return Response(
                 {'errors': 'You are not subscribed to the user'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        subscription.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        methods=['post'],
+        url_path='subscribe/batch'
+    )
+    def subscribe_batch(self, request):
+        return change_in_batch(Subscription, request)
+
     @action(
         detail=False,
         permission_classes=[IsAuthenticated],
@@ -104,48 +176,101 @@ class CustomUserViewSet(UserViewSet):
             author__user=request.user
         )
         page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = SubscriptionSerializer(
-                page, many=True, context={'request': request}
-            )
-            return self.get_paginated_response(serializer.data)
+        authors = list(queryset) if page is None else page
+        prefetch_latest_recipes(authors, get_recipes_limit(request))
         serializer = SubscriptionSerializer(
-            queryset, many=True
+            authors, many=True, context={'request': request}
         )
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        with timed(request, 'serialize'):
+            data = serializer.data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data, status=status.HTTP_200_OK)
 
 
 class RecipeViewSet(ModelViewSet):
     queryset = Recipe.objects.all().order_by('-pub_date')
     permission_classes = (AuthorOrReadOnly,)
-    pagination_class = PageLimitPagination
+    pagination_class = PageLimitOrKeysetPagination
+    cursor_ordering = ('-pub_date', '-id')
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        return queryset.only('id', 'author_id', 'pub_date', 'updated_at')
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeGetSerializer
         return RecipeCreateUpdateSerializer
 
+    @conditional('recipes')
+    @cache_anonymous('recipes')
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        recipes = list(queryset) if page is None else page
+        data = render_recipes(recipes, request)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @conditional('tags', 'ingredients', last_modified=recipe_updated_at)
+    @cache_anonymous('recipes')
+    def retrieve(self, request, *args, **kwargs):
+        data = render_recipes([self.get_object()], request)
+        if not data:
+            # Fragments are built on the primary, where the recipe
+            # a replica still has may be gone already.
+            raise NotFound()
+        return Response(data[0])
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        recipe_fragments([serializer.instance])
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        recipe_fragments([serializer.instance])
+
     @staticmethod
-    def add_or_delete_object(model, recipe, request):
-        current_object = model.objects.filter(
-            user=request.user, recipe=recipe
-        )
+    def object_changed(model, recipe, request, delta):
+        change_relation_counter(model, recipe.pk, delta)
+        if model is ShoppingCart:
+            add_to_shopping_list(request.user, recipe, sign=delta)
+        invalidate_viewer_state(request)
+
+    def add_or_delete_object(self, model, recipe, request):
+        # A single statement decides whether the row changed, so
+        # concurrent duplicates are answered with 400 and the side
+        # effects run once.
         if request.method == 'POST':
-            if current_object.exists():
+            with transaction.atomic():
+                added = add_relation(
+                    model, user_id=request.user.id, recipe_id=recipe.id
+                )
+                if added:
+                    self.object_changed(model, recipe, request, 1)
+            if not added:
                 return Response(
                     {'errors': 'It\'s already added'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            model.objects.create(user=request.user, recipe=recipe)
             serializer = RecipeShortSerializer(recipe)
             return Response(
                 serializer.data, status=status.HTTP_201_CREATED
             )
         if request.method == 'DELETE':
-            if current_object.exists():
-                current_object.delete()
+            with transaction.atomic():
+                removed = remove_relation(
+                    model, user_id=request.user.id, recipe_id=recipe.id
+                )
+                if removed:
+                    self.object_changed(model, recipe, request, -1)
+            if removed:
                 return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {'errors': 'It\'s not added'},
@@ -175,7 +300,43 @@ class RecipeViewSet(ModelViewSet):
             ShoppingCart, recipe=recipe, request=request
         )
 
-    @action(detail=False, permission_classes=(IsAuthenticated,))
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        methods=['post'],
+        url_path='favorite/batch'
+    )
+    def favorite_batch(self, request):
+        return change_in_batch(Favorite, request)
+
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        methods=['post'],
+        url_path='shopping_cart/batch'
+    )
+    def shopping_cart_batch(self, request):
+        return change_in_batch(ShoppingCart, request)
+
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            ShoppingListTextRenderer,
+            ShoppingListCSVRenderer,
+            ShoppingListJSONRenderer,
+            ShoppingListPDFRenderer,
+        )
+    )
     def download_shopping_cart(self, request):
         user = request.user
-        return download_cart(user=user)
+        return download_cart(
+            user=user, export_format=request.accepted_renderer.format
+        )
+
+
+class ResponseCacheStatsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(response_cache_stats())
@@ -0,0 +1,142 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.utils.deprecation import MiddlewareMixin
+
+PIN_KEY = 'db-pin:{client}'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = threading.local()
+
+
+def replica_aliases():
+    return [
+        alias for alias in settings.DATABASES
+        if alias != DEFAULT_DB_ALIAS
+        and settings.DATABASES[alias].get('TEST', {}).get('MIRROR')
+        == DEFAULT_DB_ALIAS
+    ]
+
+
+def pin_key(request):
+    """
+    Return the cache key of the pin of the request client, identified
+    by its Authorization header, or None for anonymous clients.
+
+    The address is no use here, since behind the proxy every client
+    shares it. Anonymous writes only create users and tokens, and
+    tokens are always looked up on the primary.
+    """
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return PIN_KEY.format(
+        client=hashlib.sha256(authorization.encode()).hexdigest()
+    )
+
+
+@contextmanager
+def primary_reads():
+    """
+    Send the reads made within to the primary.
+
+    Results stored under version stamps must be read there: a lagging
+    replica would cache data older than the stamp until it changes.
+    """
+    use_replica = getattr(_state, 'use_replica', False)
+    _state.use_replica = False
+    try:
+        yield
+    finally:
+        _state.use_replica = use_replica
+
+
+class ReplicaMiddleware(MiddlewareMixin):
+    """
+    Let the router send the queries of safe requests to replicas,
+    unless the client wrote something within REPLICA_PIN_TIMEOUT
+    seconds, so everybody reads their own writes.
+    """
+
+    def process_request(self, request):
+        _state.use_replica = False
+        _state.replica = None
+        if request.method not in SAFE_METHODS or not replica_aliases():
+            return
+        key = pin_key(request)
+        _state.use_replica = key is None or not cache.get(key)
+
+    def process_response(self, request, response):
+        key = pin_key(request)
+        if (key is not None and request.method not in SAFE_METHODS
+                and replica_aliases()):
+            cache.set(key, True, settings.REPLICA_PIN_TIMEOUT)
+        _state.use_replica = False
+        _state.replica = None
+        return response
+
+
+class ReplicaRouter:
+    """
+    Send reads of safe requests to healthy replicas in turn, one
+    replica per request, and everything else to the primary.
+
+    A replica that refuses connections is skipped for
+    REPLICA_RETRY_TIMEOUT seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._position = 0
+        self._down = {}
+
+    def is_healthy(self, alias):
+        with self._lock:
+            if self._down.get(alias, 0) > time.monotonic():
+                return False
+        connection = connections[alias]
+        if connection.connection is not None:
+            return True
+        try:
+            connection.ensure_connection()
+        except OperationalError:
+            with self._lock:
+                self._down[alias] = (
+                    time.monotonic() + settings.REPLICA_RETRY_TIMEOUT
+                )
+            return False
+        return True
+
+    def choose_replica(self):
+        replicas = replica_aliases()
+        with self._lock:
+            start = self._position
+            self._position += 1
+        for offset in range(len(replicas)):
+            alias = replicas[(start + offset) % len(replicas)]
+            if self.is_healthy(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        if not getattr(_state, 'use_replica', False):
+            return DEFAULT_DB_ALIAS
+        # Stick to one replica for the whole request, as replicas may
+        # lag behind the primary by different amounts.
+        if getattr(_state, 'replica', None) is None:
+            _state.replica = self.choose_replica()
+        return _state.replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -34,15 +35,27 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication'
+        'api.authentication.CachedTokenAuthentication'
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 
 MIDDLEWARE = [
+    'api.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.compression.CompressionMiddleware',
+    'foodgram.routers.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,6 +96,50 @@ DATABASES = {
     }
 }
 
+# Log the statements executed at least this many times in one request.
+SQL_DUPLICATE_THRESHOLD = (
+    int(os.getenv('SQL_DUPLICATE_THRESHOLD'))
+    if os.getenv('SQL_DUPLICATE_THRESHOLD') else None
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.timing': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
+# Tests send requests from several threads at once, which SQLite only
+# serves from a database file, as the in-memory test database fails on
+# table locks instead of waiting.
+if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+    DATABASES['default']['TEST'] = {
+        'NAME': os.path.join(tempfile.gettempdir(), 'foodgram_test.sqlite3')
+    }
+
+# Comma-separated replicas: hosts, or database files for SQLite.
+for number, replica in enumerate(filter(None, os.getenv(
+    'DB_REPLICAS', default=''
+).split(','))):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME' if DATABASES['default']['ENGINE'].endswith('sqlite3')
+        else 'HOST': replica.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['foodgram.routers.ReplicaRouter']
+
+# Clients read from the primary for this many seconds after a write.
+REPLICA_PIN_TIMEOUT = 5
+
+# Replicas refusing connections are skipped for this many seconds.
+REPLICA_RETRY_TIMEOUT = 30
+
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.sqlite3',
@@ -139,3 +196,55 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Version stamps in the cache invalidate the ingredient index, viewer
+# states and cached responses, so every process must share the cache:
+# all gunicorn workers and the management commands, which run in
+# processes of their own. The local memory cache only suits development,
+# see VERSION_TIMEOUT.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+if CACHES['default']['BACKEND'].endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+
+# Version stamps are kept in the database and cached. In a shared cache
+# they never expire. A process-local cache can not see bumps made by
+# other processes, so there they are read again after this many seconds,
+# which bounds how long such changes go unnoticed.
+PROCESS_LOCAL_CACHES = ('LocMemCache', 'DummyCache')
+VERSION_TIMEOUT = (
+    5 if CACHES['default']['BACKEND'].endswith(PROCESS_LOCAL_CACHES)
+    else None
+)
+
+VIEWER_STATE_TIMEOUT = 60 * 60
+
+RESPONSE_CACHE_TIMEOUT = 60 * 60
+
+# Authenticated tokens are kept per process for TOKEN_CACHE_TIMEOUT
+# seconds, which bounds how long other processes may accept a deleted
+# token. TOKEN_CACHE_SHARED also keeps them in the shared cache.
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TIMEOUT = 60
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED', default='') == 'True'
+
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+# Most ids one batch favorite, cart or subscription request may list.
+BATCH_MAX_SIZE = 100
+
+# How missing recipe fragments are built: 'values' makes plain dicts
+# from `.values()` rows, 'serializer' goes through DRF serializers.
+RECIPE_READ_SERIALIZER = os.getenv('RECIPE_READ_SERIALIZER', default='values')
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
@@ -1,11 +1,8 @@
 from django.contrib import admin
-from django.contrib.auth import get_user_model
 
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag,
                      ShoppingCart, Tag)
 
-User = get_user_model()
-
 
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
@@ -25,7 +22,7 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (RecipeIngredientInline, RecipeTagInline)
 
     def favorite_score(self, obj):
-        return User.objects.filter(is_favorited=obj).count()
+        return obj.favorites_count
 
 
 class IngredientAdmin(admin.ModelAdmin):
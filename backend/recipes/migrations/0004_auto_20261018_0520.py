@@ -0,0 +1,42 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:20
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count(model, field):
+    return Coalesce(models.Subquery(
+        model.objects.filter(**{field: models.OuterRef('pk')}).order_by(
+        ).values(field).annotate(count=models.Count('pk')).values('count')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    Recipe.objects.update(
+        favorites_count=count(Favorite, 'recipe'),
+        carts_count=count(ShoppingCart, 'recipe'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_auto_20261018_0518'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Добавлений в список покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
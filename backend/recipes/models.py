@@ -102,6 +102,19 @@ class Recipe(models.Model):
         blank=False,
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в избранное',
+        default=0,
+        db_index=True
+    )
+    carts_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в список покупок',
+        default=0
+    )
 
     def __str__(self):
         return self.name
@@ -200,3 +213,34 @@ class Favorite(models.Model):
                 name='favorite_constraints'
             )
         ]
+
+
+class ShoppingListItem(models.Model):
+    """
+    Total amount of an ingredient in the user's shopping cart,
+    maintained by delta whenever the cart or a carted recipe changes.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name=_('user')
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name=_('ingredient')
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name=_('amount')
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='shopping_list_constraints'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.ingredient}'
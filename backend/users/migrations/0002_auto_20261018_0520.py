@@ -0,0 +1,43 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:20
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count(model, field):
+    return Coalesce(models.Subquery(
+        model.objects.filter(**{field: models.OuterRef('pk')}).order_by(
+        ).values(field).annotate(count=models.Count('pk')).values('count')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    Subscription = apps.get_model('users', 'Subscription')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    CustomUser.objects.update(
+        recipes_count=count(Recipe, 'author'),
+        followers_count=count(Subscription, 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('recipes', '0002_auto_20221120_2107'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='followers count'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='recipes count'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
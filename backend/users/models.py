@@ -36,6 +36,14 @@ class CustomUser(AbstractUser):
         max_length=150,
         blank=False
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name=_('recipes count'),
+        default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name=_('followers count'),
+        default=0
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name', 'password']
 